@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the sensor service and the dashboard against an in-process mock of Ditto
+No Ditto stack needed: the harness serves the mock and runs each service as a subprocess pointed at it
+
+    python bench.py                                  # all scenarios, results in benchmark_results.json
+    python bench.py -s dashboard_poll_cycle --things 5000 --latency 20
+    python bench.py --baseline baselines/main.json   # exit 1 if a key metric regressed
+
+Scenarios:
+    sensor_throughput       open-loop writes of the sensor's benchmark mode, HTTP and WebSocket transports
+    dashboard_poll_cycle    full poll cycles of the dashboard monitor over --things things
+    socketio_fanout         latency from a change in Ditto to --clients Socket.IO clients
+    memory_growth           RSS of the dashboard and a sensor fleet streaming through the mock over time
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import random
+import shutil
+import asyncio
+import argparse
+import logging
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+import aiohttp
+import requests
+
+from mock_ditto import MockDitto, Faults
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SENSOR_DIR = os.path.join(HERE, '..', 'sensor-container')
+sys.path.insert(0, SENSOR_DIR)
+
+from loadgen import LatencyHistogram  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+THING_PATTERN = 'demo:sensor-{index}'
+READY_TIMEOUT = 60
+
+# Metrics compared against a baseline, and whether higher or lower is better
+KEY_METRICS = {
+    'sensor_throughput': {
+        'http.achieved_rate': 'higher', 'http.latency_ms.p99': 'lower',
+        'websocket.achieved_rate': 'higher', 'websocket.latency_ms.p99': 'lower'
+    },
+    'dashboard_poll_cycle': {'cycle_ms.p50': 'lower', 'cycle_ms.p90': 'lower'},
+    'socketio_fanout': {'latency_ms.p50': 'lower', 'latency_ms.p99': 'lower', 'delivered_ratio': 'higher'},
+    'memory_growth': {'dashboard.growth_mb_per_min': 'lower', 'sensor.growth_mb_per_min': 'lower'}
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid):
+    """Resident set size of a process in MiB (Linux), or None"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def percentiles(values, points=(50, 90, 99)):
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    summary = {f"p{p}": round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 3) for p in points}
+    summary.update(min=round(ordered[0], 3), max=round(ordered[-1], 3),
+                   mean=round(sum(ordered) / len(ordered), 3))
+    return summary
+
+
+def slope_per_minute(samples):
+    """Least-squares slope of (seconds, value) samples, per minute"""
+    if len(samples) < 2:
+        return 0.0
+    n = len(samples)
+    mean_t = sum(t for t, _ in samples) / n
+    mean_v = sum(v for _, v in samples) / n
+    variance = sum((t - mean_t) ** 2 for t, _ in samples)
+    if not variance:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in samples) / variance * 60
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.faults = Faults(args.latency / 1000, args.jitter / 1000, args.error_rate)
+        self.workdir = tempfile.mkdtemp(prefix='ditto-bench-')
+        self.thing_ids = [THING_PATTERN.format(index=i) for i in range(1, args.things + 1)]
+        self.children = []
+
+    def start_mock(self, churn_on_search=False, things=True):
+        mock = MockDitto(self.faults, churn_on_search=churn_on_search)
+        url = mock.start()
+        if things:
+            mock.call(mock.add_things, self.thing_ids)
+        return mock, url
+
+    def spawn(self, name, command, cwd=None, env=None):
+        """Start a service under test, logging to a file in the work directory"""
+        log = open(os.path.join(self.workdir, f"{name}.log"), 'w')
+        process = subprocess.Popen(command, cwd=cwd or self.workdir, env=dict(os.environ, **(env or {})),
+                                   stdout=log, stderr=subprocess.STDOUT)
+        self.children.append(process)
+        return process
+
+    def stop(self, process):
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def dashboard_env(self, name):
+        return {
+            'DASHBOARD_HISTORY_PATH': os.path.join(self.workdir, f"{name}-history.db"),
+            'DASHBOARD_POLLER_LOCK': os.path.join(self.workdir, f"{name}-poller.lock"),
+            'DASHBOARD_UPDATE_MODE': 'sse'
+        }
+
+    def start_dashboard(self, name, url):
+        port = free_port()
+        process = self.spawn(name, [sys.executable, os.path.join(HERE, 'dashboard_child.py'), 'serve', url, str(port)],
+                             env=self.dashboard_env(name))
+        base = f"http://127.0.0.1:{port}"
+        deadline = time.time() + READY_TIMEOUT
+        while time.time() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"dashboard exited with {process.returncode}, see {self.workdir}/{name}.log")
+            try:
+                if requests.get(f"{base}/api/things?limit=0", timeout=2).json()['total'] >= len(self.thing_ids):
+                    return process, base
+            except (requests.RequestException, ValueError, KeyError):
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"dashboard did not load {len(self.thing_ids)} things within {READY_TIMEOUT}s")
+
+    def sensor_config(self, url, **overrides):
+        config = {
+            'ditto_api_url': url,
+            'username': 'ditto',
+            'password': 'ditto',
+            'fleet': {'thing_id_pattern': THING_PATTERN, 'start_index': 1, 'count': len(self.thing_ids),
+                      'max_concurrency': 500, 'connection_pool_size': 200, 'request_timeout': 10,
+                      'stats_interval': 10},
+            'store_and_forward': {'enabled': False},
+            'metrics': {'enabled': False},
+            'logging': {'readings': 'aggregate', 'aggregate_interval': 10}
+        }
+        config.update(overrides)
+        return config
+
+    def start_sensor(self, name, config):
+        """Run sensor_service.py from a directory holding the generated sim_config.json"""
+        directory = os.path.join(self.workdir, name)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'sim_config.json'), 'w') as f:
+            json.dump(config, f, indent=2)
+        return self.spawn(name, [sys.executable, os.path.join(SENSOR_DIR, 'sensor_service.py')], cwd=directory)
+
+    def sensor_throughput(self):
+        """Open-loop write throughput and latency of the sensor's benchmark mode per transport"""
+        mock, url = self.start_mock(things=False)
+        results = {}
+        try:
+            for transport in ('http', 'websocket'):
+                name = f"sensor-{transport}"
+                report_path = os.path.join(self.workdir, f"{name}-report.json")
+                process = self.start_sensor(name, self.sensor_config(
+                    url, mode='benchmark', transport=transport,
+                    websocket={'url': None, 'response_required': True, 'max_in_flight': 1000},
+                    benchmark={'target_rate': self.args.rate, 'duration': self.args.duration, 'warmup': 2,
+                               'max_outstanding': 10000, 'report_path': report_path}))
+                process.wait(timeout=self.args.duration + 60)
+                with open(report_path) as f:
+                    report = json.load(f)
+                results[transport] = {key: report[key] for key in (
+                    'target_rate', 'achieved_rate', 'error_rate', 'timeouts', 'shed', 'latency_ms')}
+                logger.info(f"sensor {transport}: {report['achieved_rate']}/s, p99 {report['latency_ms'].get('p99')} ms")
+        finally:
+            mock.stop()
+        return results
+
+    def dashboard_poll_cycle(self):
+        """Duration of the dashboard's full poll cycle while every value changes between cycles"""
+        mock, url = self.start_mock(churn_on_search=True)
+        try:
+            process = self.spawn('dashboard-poll', [sys.executable, os.path.join(HERE, 'dashboard_child.py'),
+                                                    'poll-cycle', url, str(self.args.cycles)],
+                                 env=self.dashboard_env('dashboard-poll'))
+            process.wait(timeout=600)
+            with open(os.path.join(self.workdir, 'dashboard-poll.log')) as f:
+                output = json.loads(f.read().strip().splitlines()[-1])
+        finally:
+            mock.stop()
+        # The first cycle creates every row, the steady state is what polling costs
+        steady = output['durations'][1:] or output['durations']
+        result = {
+            'things': output['things'],
+            'cycles': len(output['durations']),
+            'first_cycle_ms': round(output['durations'][0] * 1000, 3),
+            'cycle_ms': percentiles([d * 1000 for d in steady]),
+            'injected_errors': mock.counts['errors']
+        }
+        logger.info(f"poll cycle over {result['things']} things: p50 {result['cycle_ms']['p50']} ms")
+        return result
+
+    async def socketio_client(self, session, base, thing_id, histogram, counts, subscribed, stop):
+        """A minimal Engine.IO v4 / Socket.IO client recording the delay of each delta"""
+        async with session.ws_connect(f"{base.replace('http', 'ws', 1)}/socket.io/?EIO=4&transport=websocket") as ws:
+            await ws.send_str('40')
+            await ws.send_str('42' + json.dumps(['subscribe', {'thingId': thing_id}]))
+            while not stop.is_set():
+                try:
+                    message = await ws.receive(timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+                if message.data == '2':
+                    await ws.send_str('3')
+                elif message.data.startswith('42'):
+                    event, data = json.loads(message.data[2:])
+                    if event == 'thing_snapshot':
+                        subscribed.append(thing_id)
+                    elif event == 'data_delta' and 'timestamp' in data['changes']:
+                        counts['received'] += 1
+                        # The mock stamps each reading with its epoch milliseconds
+                        delay = time.time() * 1000 - float(data['changes']['timestamp'])
+                        histogram.record(delay * 1000)
+
+    async def fanout(self, base, mock):
+        clients = self.args.clients
+        watched = self.thing_ids[:min(len(self.thing_ids), self.args.fanout_things)]
+        histogram = LatencyHistogram()
+        counts = {'received': 0}
+        subscribed = []
+        stop = asyncio.Event()
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            tasks = [asyncio.create_task(self.socketio_client(session, base, watched[i % len(watched)],
+                                                              histogram, counts, subscribed, stop))
+                     for i in range(clients)]
+            deadline = time.time() + READY_TIMEOUT
+            while len(subscribed) < clients and time.time() < deadline:
+                await asyncio.sleep(0.1)
+            written = await asyncio.wrap_future(mock.drive(watched, self.args.update_rate, self.args.duration))
+            await asyncio.sleep(1)  # let the last updates arrive
+            client_metrics = (await asyncio.to_thread(requests.get, f"{base}/api/clients", timeout=5)).json()['total']
+            stop.set()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        # Each write reaches the clients watching its thing
+        expected = clients * written // len(watched)
+        return {
+            'clients': clients,
+            'subscribed': len(subscribed),
+            'things_watched': len(watched),
+            'update_rate': self.args.update_rate,
+            'writes': written,
+            'deltas_received': counts['received'],
+            'delivered_ratio': round(counts['received'] / expected, 4) if expected else 0,
+            'coalesced': client_metrics['coalesced'],
+            'dropped': client_metrics['dropped'],
+            'latency_ms': histogram.summary()
+        }
+
+    def socketio_fanout(self):
+        """Delay from a change written into the mock Ditto to each subscribed Socket.IO client"""
+        mock, url = self.start_mock()
+        dashboard = None
+        try:
+            dashboard, base = self.start_dashboard('dashboard-fanout', url)
+            result = asyncio.run(self.fanout(base, mock))
+        finally:
+            if dashboard is not None:
+                self.stop(dashboard)
+            mock.stop()
+        logger.info(f"fan-out to {result['clients']} clients: p50 {result['latency_ms'].get('p50')} ms, "
+                    f"p99 {result['latency_ms'].get('p99')} ms")
+        return result
+
+    def memory_growth(self):
+        """RSS over time of the dashboard following a sensor fleet writing through the mock"""
+        mock, url = self.start_mock()
+        dashboard = sensor = None
+        try:
+            dashboard, _ = self.start_dashboard('dashboard-memory', url)
+            sensor = self.start_sensor('sensor-memory', self.sensor_config(
+                url, mode='fleet', transport='http', update_interval=self.args.sensor_interval))
+            samples = {'dashboard': [], 'sensor': []}
+            started = time.time()
+            while time.time() - started < self.args.memory_duration:
+                elapsed = time.time() - started
+                for name, process in (('dashboard', dashboard), ('sensor', sensor)):
+                    rss = rss_mb(process.pid)
+                    if rss is not None:
+                        samples[name].append((elapsed, rss))
+                time.sleep(1)
+            writes = mock.counts['write']
+        finally:
+            for process in (sensor, dashboard):
+                if process is not None:
+                    self.stop(process)
+            mock.stop()
+        result = {'duration': self.args.memory_duration, 'writes': writes}
+        for name, series in samples.items():
+            # The first fifth is warm-up: imports, connection pools and the first rows
+            steady = series[len(series) // 5:]
+            result[name] = {
+                'rss_start_mb': round(steady[0][1], 1) if steady else None,
+                'rss_end_mb': round(steady[-1][1], 1) if steady else None,
+                'rss_max_mb': round(max(v for _, v in series), 1) if series else None,
+                'growth_mb_per_min': round(slope_per_minute(steady), 3)
+            }
+            logger.info(f"{name} RSS {result[name]['rss_start_mb']} -> {result[name]['rss_end_mb']} MiB, "
+                        f"{result[name]['growth_mb_per_min']} MiB/min")
+        return result
+
+    def close(self):
+        for process in self.children:
+            self.stop(process)
+        if self.args.keep_workdir:
+            logger.info(f"Logs kept in {self.workdir}")
+        else:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+SCENARIOS = ['sensor_throughput', 'dashboard_poll_cycle', 'socketio_fanout', 'memory_growth']
+
+
+def lookup(result, dotted):
+    for key in dotted.split('.'):
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Return a line per key metric that is worse than the baseline by more than tolerance"""
+    regressions = []
+    for scenario, metrics in KEY_METRICS.items():
+        if scenario not in results['scenarios'] or scenario not in baseline.get('scenarios', {}):
+            continue
+        for metric, better in metrics.items():
+            new = lookup(results['scenarios'][scenario], metric)
+            old = lookup(baseline['scenarios'][scenario], metric)
+            if not isinstance(new, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            if better == 'higher':
+                worse = new < old * (1 - tolerance)
+            else:
+                # Growth hovers around zero, so compare it with an absolute allowance as well
+                worse = new > old * (1 + tolerance) and new - old > tolerance
+            if worse:
+                regressions.append(f"{scenario}.{metric}: {old} -> {new} ({better} is better)")
+    return regressions
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--scenario', action='append', choices=SCENARIOS,
+                        help='scenario to run (repeatable, default: all)')
+    parser.add_argument('--things', type=int, default=1000, help='things known to the mock')
+    parser.add_argument('--clients', type=int, default=100, help='Socket.IO clients in the fan-out scenario')
+    parser.add_argument('--fanout-things', type=int, default=10, help='distinct things the clients subscribe to')
+    parser.add_argument('--update-rate', type=float, default=5, help='updates per second of each watched thing')
+    parser.add_argument('--rate', type=int, default=2000, help='target writes per second of the sensor benchmark')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of each throughput/fan-out run')
+    parser.add_argument('--cycles', type=int, default=20, help='poll cycles to time')
+    parser.add_argument('--memory-duration', type=float, default=60, help='seconds of the memory growth run')
+    parser.add_argument('--sensor-interval', type=float, default=1.0, help='seconds between readings per thing')
+    parser.add_argument('--latency', type=float, default=0, help='injected mock latency in ms')
+    parser.add_argument('--jitter', type=float, default=0, help='injected random extra latency up to ms')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of mock requests failing with 503')
+    parser.add_argument('--seed', type=int, help='seed of the injected faults and values')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the results')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--keep-workdir', action='store_true', help='keep the service logs')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    harness = Harness(args)
+    results = {
+        'timestamp': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'revision': revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'parameters': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'keep_workdir')},
+        'faults': harness.faults.describe(),
+        'scenarios': {}
+    }
+    try:
+        for scenario in args.scenario or SCENARIOS:
+            logger.info(f"Running {scenario}...")
+            results['scenarios'][scenario] = getattr(harness, scenario)()
+    finally:
+        harness.close()
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            logger.warning(f"Regression: {line}")
+        if regressions:
+            sys.exit(1)
+        logger.info(f"No regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
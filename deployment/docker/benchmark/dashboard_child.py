@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Runs the dashboard against the mock Ditto in a process of its own
+The dashboard monkey-patches its process for eventlet, so it never shares one with the harness
+
+    dashboard_child.py serve <ditto url> <port>
+    dashboard_child.py poll-cycle <ditto url> <cycles>
+"""
+
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dashboard'))
+
+import app as dashboard  # noqa: E402  (patches the process for eventlet first)
+
+
+def serve(ditto_url, port):
+    """Run the dashboard server, as `python app.py` would but without the debug reloader"""
+    dashboard.DITTO_API_URL = ditto_url
+    dashboard.monitor.start_monitoring()
+    dashboard.socketio.run(dashboard.app, host='127.0.0.1', port=port, log_output=False)
+
+
+def poll_cycle(ditto_url, cycles):
+    """Time full poll cycles (search, health, diff, publish and record) back to back and print them as JSON"""
+    dashboard.DITTO_API_URL = ditto_url
+    monitor = dashboard.monitor
+    monitor.bus.subscribe(monitor.apply)
+    monitor.is_poller = True
+    durations = []
+    for _ in range(cycles):
+        started = time.perf_counter()
+        monitor.update_data()
+        durations.append(time.perf_counter() - started)
+    monitor.history.close()
+    print(json.dumps({'things': len(monitor.things), 'durations': durations}))
+
+
+if __name__ == '__main__':
+    command, ditto_url, number = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    if command == 'serve':
+        serve(ditto_url, number)
+    elif command == 'poll-cycle':
+        poll_cycle(ditto_url, number)
+    else:
+        sys.exit(f"unknown command {command}")
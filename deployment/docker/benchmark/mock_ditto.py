@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+In-process mock of the Ditto endpoints used by the sensor service and the dashboard
+Things API, search, server-sent events and the Ditto Protocol WebSocket, with latency and error injection
+"""
+
+import re
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+
+from aiohttp import web, WSMsgType
+
+try:
+    import cbor2
+except ImportError:  # optional, only for accepting CBOR bodies
+    cbor2 = None
+
+logger = logging.getLogger(__name__)
+
+# Marks a request body in a media type the mock does not take
+UNSUPPORTED = object()
+LIKE_FILTER = re.compile(r'like\(thingId,"([^"]*)"\)')
+IN_FILTER = re.compile(r'in\(thingId,((?:"[^"]*",?)+)\)')
+PAGE_OPTION = re.compile(r'(size|cursor)\(([^)]*)\)')
+
+
+def merge_patch(target, patch):
+    """Apply a JSON merge patch (RFC 7396), returning a new object"""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def thing_matcher(rql):
+    """Match thing IDs against the like(thingId,"...") and in(thingId,...) filters the services use; no filter matches all"""
+    listed = IN_FILTER.search(rql or '')
+    if listed:
+        thing_ids = set(re.findall(r'"([^"]*)"', listed.group(1)))
+        return lambda thing_id: thing_id in thing_ids
+    match = LIKE_FILTER.search(rql or '')
+    if not match:
+        return lambda thing_id: True
+    pattern = re.compile('^' + '.*'.join(re.escape(part) for part in match.group(1).split('*')) + '$')
+    return lambda thing_id: bool(pattern.match(thing_id))
+
+
+def nest(path, value):
+    """Wrap value into the objects of a JSON pointer, e.g. /features/temp -> {'features': {'temp': value}}"""
+    for key in reversed([p for p in path.split('/') if p]):
+        value = {key: value}
+    return value
+
+
+class Faults:
+    """Latency and errors injected into every request and WebSocket response"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    async def inject(self):
+        """Delay like a loaded server; return an error status to answer with instead, or None"""
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            return self.error_status
+        return None
+
+    def describe(self):
+        return {'latency_ms': self.latency * 1000, 'jitter_ms': self.jitter * 1000,
+                'error_rate': self.error_rate, 'error_status': self.error_status}
+
+
+class MockDitto:
+    """Things kept in a dict; every change is pushed to the open event streams"""
+
+    def __init__(self, faults=None, churn_on_search=False, accept_cbor=False):
+        self.faults = faults or Faults()
+        # Change every value before each full search, so pollers always find work to do
+        self.churn_on_search = churn_on_search
+        # Like the real gateway, other bodies than JSON are answered with 415 unless CBOR is accepted
+        self.accept_cbor = accept_cbor and cbor2 is not None
+        self.things = {}
+        self.policies = {}
+        self.streams = []
+        self.counts = {'health': 0, 'search': 0, 'get': 0, 'write': 0, 'sse': 0, 'ws_commands': 0, 'errors': 0,
+                       'policies': 0, 'body_bytes': 0}
+        self.loop = None
+        self.runner = None
+        self.thread = None
+
+    def add_things(self, thing_ids, properties=None):
+        for thing_id in thing_ids:
+            self.things[thing_id] = {
+                'thingId': thing_id,
+                'features': {'temp': {'properties': dict(properties or {
+                    'value': 25.0, 'unit': 'celsius', 'timestamp': str(int(time.time() * 1000)), 'status': 'active'
+                })}}
+            }
+
+    def write(self, thing_id, path, value, merge=False):
+        """Apply a modify or merge command; returns the HTTP status Ditto would answer with"""
+        created = thing_id not in self.things
+        if path in ('', '/'):
+            current = self.things.get(thing_id, {})
+            thing = merge_patch(current, value) if merge else dict(value)
+            change = value
+        else:
+            current = self.things.get(thing_id, {'thingId': thing_id})
+            change = nest(path, value)
+            if not merge:
+                # A modify replaces the value at path, so clear it before merging the new one in
+                current = merge_patch(current, nest(path, None))
+            thing = merge_patch(current, change)
+        thing['thingId'] = thing_id
+        self.things[thing_id] = thing
+        self.counts['write'] += 1
+        for matches, queue in self.streams:
+            if matches(thing_id):
+                queue.put_nowait(dict(change, thingId=thing_id))
+        return 201 if created else 204
+
+    def set_temperature(self, thing_id, value):
+        """Write a reading stamped with the current epoch milliseconds, for end-to-end latency"""
+        return self.write(thing_id, '/features/temp/properties',
+                          {'value': value, 'timestamp': str(time.time() * 1000)}, merge=True)
+
+    async def faulted(self):
+        status = await self.faults.inject()
+        if status is not None:
+            self.counts['errors'] += 1
+            return web.json_response({'status': status, 'error': 'mock.injected'}, status=status)
+        return None
+
+    async def health(self, request):
+        self.counts['health'] += 1
+        return await self.faulted() or web.json_response({'status': 'UP'})
+
+    async def search(self, request):
+        self.counts['search'] += 1
+        error = await self.faulted()
+        if error:
+            return error
+        size, cursor = 25, None
+        for name, value in PAGE_OPTION.findall(request.query.get('option', '')):
+            if name == 'size':
+                size = int(value)
+            else:
+                cursor = value
+        if cursor is None and self.churn_on_search:
+            for thing in self.things.values():
+                properties = thing.get('features', {}).get('temp', {}).get('properties')
+                if properties is not None:
+                    properties['value'] = round(random.uniform(20, 40), 1)
+        matches = thing_matcher(request.query.get('filter'))
+        thing_ids = sorted(t for t in self.things if matches(t))
+        start = int(cursor or 0)
+        page = {'items': [self.things[t] for t in thing_ids[start:start + size]]}
+        if start + size < len(thing_ids):
+            page['cursor'] = str(start + size)
+        return web.json_response(page)
+
+    async def things_stream(self, request):
+        """GET /api/2/things: a change stream for text/event-stream, otherwise a plain list"""
+        if 'text/event-stream' not in request.headers.get('Accept', ''):
+            error = await self.faulted()
+            ids = request.query.get('ids', '')
+            return error or web.json_response([self.things[t] for t in ids.split(',') if t in self.things])
+        self.counts['sse'] += 1
+        error = await self.faulted()
+        if error:
+            return error
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+        queue = asyncio.Queue()
+        stream = (thing_matcher(request.query.get('filter')), queue)
+        self.streams.append(stream)
+        try:
+            while True:
+                try:
+                    change = await asyncio.wait_for(queue.get(), timeout=1)
+                except asyncio.TimeoutError:
+                    await response.write(b'\n')  # heartbeat after 1s idle, as Ditto sends
+                    continue
+                await response.write(b'data:' + json.dumps(change).encode('utf-8') + b'\n\n')
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self.streams.remove(stream)
+        return response
+
+    async def thing_resource(self, request):
+        """GET, PUT and PATCH of /api/2/things/<thingId>[/<path>]"""
+        error = await self.faulted()
+        if error:
+            return error
+        thing_id, _, path = request.match_info['rest'].partition('/')
+        path = '/' + path
+        if path == '/' and request.headers.get('If-None-Match') == '*' and thing_id in self.things:
+            return web.json_response({'status': 412, 'error': 'things:precondition.notmodified'}, status=412)
+        if request.method == 'GET':
+            self.counts['get'] += 1
+            value = self.things.get(thing_id)
+            for key in [p for p in path.split('/') if p]:
+                value = value.get(key) if isinstance(value, dict) else None
+            if value is None:
+                return web.json_response({'status': 404, 'error': 'things:thing.notfound'}, status=404)
+            return web.json_response(value)
+        body = await self.body(request)
+        if body is UNSUPPORTED:
+            return web.json_response({'status': 415, 'error': 'mediatype.unsupported'}, status=415)
+        status = self.write(thing_id, path, body, merge=request.method == 'PATCH')
+        return web.Response(status=status)
+
+    async def body(self, request):
+        """Decoded request body, or UNSUPPORTED for media types the gateway would answer with 415"""
+        raw = await request.read()
+        self.counts['body_bytes'] += len(raw)
+        if request.content_type == 'application/cbor' and self.accept_cbor:
+            return cbor2.loads(raw)
+        if request.content_type in ('application/json', 'application/merge-patch+json'):
+            return json.loads(raw)
+        return UNSUPPORTED
+
+    async def policy(self, request):
+        """PUT /api/2/policies/<policyId>, honouring If-None-Match: *"""
+        error = await self.faulted()
+        if error:
+            return error
+        policy_id = request.match_info['policy_id']
+        if request.headers.get('If-None-Match') == '*' and policy_id in self.policies:
+            return web.json_response({'status': 412, 'error': 'policies:precondition.notmodified'}, status=412)
+        body = await self.body(request)
+        if body is UNSUPPORTED:
+            return web.json_response({'status': 415, 'error': 'mediatype.unsupported'}, status=415)
+        self.counts['policies'] += 1
+        created = policy_id not in self.policies
+        self.policies[policy_id] = body
+        return web.Response(status=201 if created else 204)
+
+    async def websocket(self, request):
+        """Ditto Protocol over WebSocket: twin modify/merge commands, answered when a response is required"""
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            try:
+                envelope = json.loads(message.data)
+            except ValueError:
+                continue  # START-SEND-* and other plain text protocol messages
+            self.counts['ws_commands'] += 1
+            asyncio.create_task(self.answer(ws, envelope))
+        return ws
+
+    async def answer(self, ws, envelope):
+        namespace, name, _, _, _, action = envelope['topic'].split('/')
+        headers = envelope.get('headers', {})
+        status = await self.faults.inject()
+        if status is None:
+            status = self.write(f"{namespace}:{name}", envelope.get('path', '/'), envelope.get('value'),
+                                merge=action == 'merge')
+        else:
+            self.counts['errors'] += 1
+        if headers.get('response-required', True) and not ws.closed:
+            await ws.send_str(json.dumps({
+                'topic': envelope['topic'],
+                'headers': {'correlation-id': headers.get('correlation-id')},
+                'path': envelope.get('path', '/'),
+                'status': status
+            }))
+
+    def app(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_get('/health', self.health)
+        app.router.add_get('/api/2/search/things', self.search)
+        app.router.add_get('/api/2/things', self.things_stream)
+        app.router.add_route('*', '/api/2/things/{rest:.+}', self.thing_resource)
+        app.router.add_put('/api/2/policies/{policy_id}', self.policy)
+        app.router.add_get('/ws/2', self.websocket)
+        return app
+
+    def start(self, host='127.0.0.1', port=0):
+        """Serve on a background thread with its own event loop; returns the base URL"""
+        started = threading.Event()
+
+        def serve():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.runner = web.AppRunner(self.app(), access_log=None)
+            self.loop.run_until_complete(self.runner.setup())
+            site = web.TCPSite(self.runner, host, port)
+            self.loop.run_until_complete(site.start())
+            self.port = self.runner.addresses[0][1]
+            started.set()
+            self.loop.run_forever()
+            self.loop.run_until_complete(self.runner.cleanup())
+            self.loop.close()
+
+        self.thread = threading.Thread(target=serve, name='mock-ditto', daemon=True)
+        self.thread.start()
+        started.wait()
+        logger.info(f"Mock Ditto listening on http://{host}:{self.port}")
+        return f"http://{host}:{self.port}"
+
+    def call(self, function, *args):
+        """Run function on the mock's event loop and wait for its result"""
+        future = asyncio.run_coroutine_threadsafe(self.run(function, *args), self.loop)
+        return future.result()
+
+    @staticmethod
+    async def run(function, *args):
+        return function(*args)
+
+    def drive(self, thing_ids, rate, duration):
+        """Write a fresh reading to each thing rate times per second for duration seconds, on the mock's loop"""
+        async def drive():
+            interval = 1.0 / rate
+            loop = asyncio.get_running_loop()
+            start = next_tick = loop.time()
+            written = 0
+            while loop.time() - start < duration:
+                for thing_id in thing_ids:
+                    self.set_temperature(thing_id, round(random.uniform(20, 40), 2))
+                    written += 1
+                next_tick += interval
+                await asyncio.sleep(max(0, next_tick - loop.time()))
+            return written
+        return asyncio.run_coroutine_threadsafe(drive(), self.loop)
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5)
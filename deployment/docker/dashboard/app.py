@@ -4,40 +4,163 @@ Professional Digital Twin Dashboard
 Real-time monitoring of temperature sensor and Digital Twin status
 """
 
-from flask import Flask, render_template, jsonify, request
+# Cooperative sockets, so the monitor's HTTP calls and emits share the server's event loop
+import eventlet
+import eventlet.wsgi
+eventlet.monkey_patch()
+
+from flask import Flask, render_template, request, abort, jsonify
 from flask_socketio import SocketIO, emit
 import requests
+from requests.adapters import HTTPAdapter
+import os
+import sys
+import hmac
 import json
 import time
-import threading
-from datetime import datetime
+import signal
+import socket
+from datetime import datetime, timezone
 import logging
 
+from things import ThingTable
+from history import HistoryStore, DOWNSAMPLERS, parse_timestamp
+from snapshots import SnapshotCache
+from stats import StatsEngine, parse_windows
+from outbox import Outboxes
+from coordination import LocalBus, LocalElection, SharedMemoryBus, FileLockElection
+import tracing
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'ditto-dashboard-secret'
-socketio = SocketIO(app, cors_allowed_origins="*")
 
 # Configuration
 DITTO_API_URL = "http://nginx:80"
 DITTO_CREDENTIALS = ("ditto", "ditto")
+# Thing shown when the page does not name one; auto-created if missing
 THING_ID = "demo:sensor-1"
+# RQL filter selecting the things to monitor, and the fields fetched for each
+THING_FILTER = os.environ.get('DASHBOARD_THING_FILTER', 'like(thingId,"demo:sensor-*")')
+THING_FIELDS = "thingId,policyId,attributes,features/temp/properties"
+SEARCH_PAGE_SIZE = int(os.environ.get('DASHBOARD_SEARCH_PAGE_SIZE', '200'))
+# Recent samples kept in memory per thing; all samples are persisted for the retention period
+HISTORY_PATH = os.environ.get('DASHBOARD_HISTORY_PATH', 'history.db')
+HISTORY_HOT_POINTS = int(os.environ.get('DASHBOARD_HISTORY_HOT_POINTS', '300'))
+HISTORY_RETENTION_DAYS = float(os.environ.get('DASHBOARD_HISTORY_RETENTION_DAYS', '2'))
+# Samples may arrive this late (sensor timestamps vs. arrival), older ranges no longer change
+HISTORY_SETTLE_SECONDS = 60
+# Sliding windows of the live statistics; fleet statistics are pushed to clients every STATS_INTERVAL
+STATS_WINDOWS = parse_windows(os.environ.get('DASHBOARD_STATS_WINDOWS', '1m,15m,1h'))
+STATS_INTERVAL = 5.0
+# History points sent with a thing's snapshot
+SNAPSHOT_HISTORY_POINTS = 20
+# Updates waiting per client (one per thing, latest wins) and frames in its transport at once
+OUTBOX_MAX_FRAMES = 256
+OUTBOX_IN_FLIGHT = 2
+# Socket.IO packets as 'json' text or binary 'msgpack' (needs msgpack, the page loads the matching parser)
+SOCKETIO_SERIALIZER = os.environ.get('DASHBOARD_SOCKETIO_SERIALIZER', 'json')
+# 'sse' follows Ditto's server-sent events, 'poll' re-fetches everything every second
+UPDATE_MODE = os.environ.get('DASHBOARD_UPDATE_MODE', 'sse')
+RECONNECT_DELAY_MAX = 30
+POLL_INTERVAL = 1.0
+# Ditto sends a heartbeat on an idle event stream every second; this much silence means the connection is dead
+SSE_HEARTBEAT_INTERVAL = 1.0
+SSE_READ_TIMEOUT = 10 * SSE_HEARTBEAT_INTERVAL
+# Keep-alive connections to Ditto shared by the event stream, searches and health checks
+HTTP_POOL_SIZE = 8
+# Worker processes serving clients; one of them is elected to poll Ditto for all
+WORKERS = int(os.environ.get('DASHBOARD_WORKERS', '1'))
+POLLER_LOCK_PATH = os.environ.get('DASHBOARD_POLLER_LOCK', '/tmp/dashboard-poller.lock')
+SHARED_BUS_BYTES = 16 * 1024 * 1024
+ELECTION_INTERVAL = 1.0
+PORT = 5000
+# Spans of the poll cycle and fan-out as OTLP/JSON lines; no path disables tracing
+TRACE_PATH = os.environ.get('DASHBOARD_TRACE_PATH', '')
+TRACE_SAMPLE_RATE = float(os.environ.get('DASHBOARD_TRACE_SAMPLE_RATE', '1.0'))
+# Token required in the X-Admin-Token header of the /admin endpoints; without one they do not exist
+ADMIN_TOKEN = os.environ.get('DASHBOARD_ADMIN_TOKEN', '')
+
+tracing.configure('digital-twin-dashboard', TRACE_PATH, TRACE_SAMPLE_RATE)
+
+socketio = SocketIO(app, cors_allowed_origins="*",
+                    serializer='msgpack' if SOCKETIO_SERIALIZER == 'msgpack' else 'default')
+
+
+def format_point(timestamp, value):
+    """Turn a (epoch seconds, value) sample into the point format of the API"""
+    return {
+        'value': value,
+        'timestamp': datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'time': datetime.fromtimestamp(timestamp).strftime('%H:%M:%S')
+    }
+
+
+def history_columns(points):
+    """Turn (epoch seconds, value) samples into the columnar history of the Socket.IO updates
+
+    Epoch milliseconds in 't' and values in 'v' repeat no keys or date strings per point, so they
+    stay small as JSON and pack into plain ints and floats as MessagePack."""
+    return {'t': [round(ts * 1000) for ts, _ in points], 'v': [value for _, value in points]}
+
+
+def join_history(older, newer):
+    """Concatenate two columnar histories, keeping the most recent SNAPSHOT_HISTORY_POINTS"""
+    return {column: (older[column] + newer[column])[-SNAPSHOT_HISTORY_POINTS:] for column in ('t', 'v')}
+
+
+def merge_update(event, pending, delta):
+    """Fold a thing's delta into the update of the same thing still queued for a client"""
+    historical = join_history(pending['historical'], delta['historical'])
+    if event == 'thing_snapshot':
+        properties = dict(pending['features']['temp']['properties'], **delta['changes'])
+        return event, dict(pending, version=delta['version'], features={'temp': {'properties': properties}},
+                           historical=historical, stats=delta['stats'])
+    # Spans both versions, so the client's chain of bases stays unbroken
+    return event, dict(delta, base=pending['base'], changes=dict(pending['changes'], **delta['changes']),
+                       historical=historical)
+
 
 class DigitalTwinMonitor:
-    def __init__(self):
-        self.current_data = {}
-        self.historical_data = []
-        self.system_status = {}
+    """Serves this worker's clients from state messages; the elected worker also polls Ditto and publishes them"""
+    
+    def __init__(self, bus, election):
+        self.bus = bus
+        self.election = election
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.is_poller = False
+        # The poller's view of Ditto, diffed to find what to publish
+        self.polled = ThingTable()
+        self.published_health = {}
+        self.full_sync_pending = False
+        self.synced = 0
+        # This worker's state, built from the published messages
+        self.things = ThingTable()
+        self.history = HistoryStore(HISTORY_PATH, HISTORY_HOT_POINTS, HISTORY_RETENTION_DAYS)
+        self.stats = StatsEngine(STATS_WINDOWS)
+        self.health = {}
+        self.health_version = 0
         self.running = True
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.default_thing_ready = False
+        self.last_poll_seconds = 0.0
+        # Socket.IO subscriptions: clients per thing, things per client
+        self.subscribers = {}
+        self.client_things = {}
+        # Last version announced to each thing's subscribers, the base of its next delta
+        self.sent_versions = {}
         
     def ensure_thing_exists(self):
         """Auto-create thing if it doesn't exist"""
         try:
             url = f"{DITTO_API_URL}/api/2/things/{THING_ID}"
-            response = requests.get(url, auth=DITTO_CREDENTIALS, timeout=5)
+            response = self.session.get(url, auth=DITTO_CREDENTIALS, timeout=5)
             
             if response.status_code == 200:
                 return True  # Thing exists
@@ -62,7 +185,7 @@ class DigitalTwinMonitor:
                 }
                 
                 # Try to create without policyId first (auto-creates policy)
-                create_response = requests.put(
+                create_response = self.session.put(
                     url,
                     json=thing_json,
                     auth=DITTO_CREDENTIALS,
@@ -82,58 +205,14 @@ class DigitalTwinMonitor:
             logger.error(f"Error checking/creating thing: {e}")
             return False
     
-    def get_thing_data(self):
-        """Get current Digital Twin data"""
-        try:
-            # Ensure thing exists first
-            self.ensure_thing_exists()
-            
-            url = f"{DITTO_API_URL}/api/2/things/{THING_ID}"
-            response = requests.get(url, auth=DITTO_CREDENTIALS, timeout=5)
-            
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    'thingId': data.get('thingId', ''),
-                    'policyId': data.get('policyId', ''),
-                    'attributes': data.get('attributes', {}),
-                    'features': data.get('features', {}),
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-            else:
-                logger.error(f"Failed to get thing data: {response.status_code}")
-                return None
-        except Exception as e:
-            logger.error(f"Error getting thing data: {e}")
-            return None
-    
-    def get_temperature_data(self):
-        """Get current temperature data"""
-        try:
-            url = f"{DITTO_API_URL}/api/2/things/{THING_ID}/features/temp/properties"
-            response = requests.get(url, auth=DITTO_CREDENTIALS, timeout=5)
-            
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    'value': data.get('value', 0),
-                    'unit': data.get('unit', 'celsius'),
-                    'timestamp': data.get('timestamp', ''),
-                    'status': data.get('status', 'unknown')
-                }
-            else:
-                logger.error(f"Failed to get temperature data: {response.status_code}")
-                return None
-        except Exception as e:
-            logger.error(f"Error getting temperature data: {e}")
-            return None
-    
-    def get_system_health(self):
+    def get_system_health(self, parent=None):
         """Get system health status"""
         try:
             # Check Ditto health
             health_url = f"{DITTO_API_URL}/health"
-            health_response = requests.get(health_url, timeout=5)
+            with tracing.span('ditto.health', tracing.CLIENT, parent) as span:
+                health_response = self.session.get(health_url, timeout=5)
+                span.set('http.status_code', health_response.status_code)
             ditto_status = "UP" if health_response.status_code == 200 else "DOWN"
             
             # Check sensor container (simulated)
@@ -156,139 +235,543 @@ class DigitalTwinMonitor:
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
     
+    def stream_health(self):
+        """Health while the event stream is open; Ditto is evidently up, so no /health call is needed"""
+        return {
+            'ditto': "UP",
+            'sensor': "RUNNING",
+            'api': "UP",
+            'database': "UP",
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+    
+    def get_history(self, thing_id, count=None):
+        """Return the most recent history points of a thing, as columns"""
+        return history_columns(self.history.recent(thing_id, count))
+    
+    def build_emit_data(self, thing_id):
+        """Build the full snapshot of one thing from the current state"""
+        version, properties = self.things.snapshot(thing_id) or (0, {})
+        return {
+            'thingId': thing_id,
+            'version': version,
+            'features': {
+                'temp': {
+                    'properties': properties
+                }
+            },
+            'health': self.health,
+            'historical': self.get_history(thing_id, SNAPSHOT_HISTORY_POINTS),
+            'stats': self.stats.thing(thing_id)
+        }
+    
+    def subscribe(self, sid, thing_id):
+        self.client_things.setdefault(sid, set()).add(thing_id)
+        self.subscribers.setdefault(thing_id, set()).add(sid)
+        # Replaces any delta of the thing still queued for the client
+        outboxes.send(sid, ('thing', thing_id), 'thing_snapshot', self.build_emit_data(thing_id))
+    
+    def unsubscribe(self, sid, thing_id):
+        self.client_things.get(sid, set()).discard(thing_id)
+        sids = self.subscribers.get(thing_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self.subscribers[thing_id]
+    
+    def drop_client(self, sid):
+        for thing_id in list(self.client_things.get(sid, ())):
+            self.unsubscribe(sid, thing_id)
+        self.client_things.pop(sid, None)
+    
+    def set_health(self, health):
+        """Store the system health and tell every client"""
+        self.health = health
+        self.health_version += 1
+        outboxes.broadcast('health', 'health_update', health)
+    
+    def apply(self, message):
+        """Apply a state message from the poller and notify this worker's clients"""
+        with tracing.span('state.apply', things=len(message.get('changes', ()))):
+            self.apply_message(message)
+    
+    def apply_message(self, message):
+        full = message.get('full', False)
+        changed = {}
+        for thing_id, properties in message.get('changes', {}).items():
+            changes = self.things.update(thing_id, properties, replace=full)
+            if changes:
+                changed[thing_id] = changes
+        # Published in full, so they replace what this worker has
+        for thing_id, meta in message.get('meta', {}).items():
+            self.things.update_meta(thing_id, meta, replace=True)
+        removed = message.get('removed', [])
+        if full:
+            removed = [t for t in self.things.index if t not in message['changes']]
+        for thing_id in removed:
+            self.things.remove(thing_id)
+            self.history.forget(thing_id)
+            self.stats.forget(thing_id)
+            self.sent_versions.pop(thing_id, None)
+        for thing_id, changes in changed.items():
+            self.record(thing_id, changes)
+        if message.get('health') and message['health'] != self.health:
+            self.set_health(message['health'])
+        if 'error' in message:
+            outboxes.broadcast('error', 'data_update', {'error': True, 'message': message['error']})
+    
+    def record(self, thing_id, changes):
+        """Add a thing's current temperature to its history and queue the change for its subscribers"""
+        version, properties = self.things.snapshot(thing_id)
+        # Always the arrival time: sensor timestamps have second resolution, may lag or be left behind by
+        # value-only writes, and mixing both clocks would put samples out of order
+        timestamp = time.time()
+        # Every worker keeps the hot window, only the poller writes the shared store
+        self.history.append(thing_id, timestamp, properties['value'], persist=self.is_poller)
+        self.stats.add(thing_id, properties['value'])
+        
+        base = self.sent_versions.get(thing_id, 0)
+        self.sent_versions[thing_id] = version
+        sids = self.subscribers.get(thing_id)
+        if not sids:
+            return  # nobody is watching, joining clients get a snapshot
+        # Clients apply a delta only on top of the version it was built from, otherwise they resync
+        delta = {
+            'thingId': thing_id,
+            'version': version,
+            'base': base,
+            'changes': changes,
+            'historical': history_columns([(timestamp, properties['value'])]),
+            'stats': self.stats.thing(thing_id)
+        }
+        # Only queued here; each client's sender task writes at the pace that client reads
+        for sid in list(sids):
+            outboxes.send(sid, ('thing', thing_id), 'data_delta', delta, merge_update)
+    
+    def search_things(self):
+        """Yield (thingId, temp properties, policyId and attributes) of every thing matching THING_FILTER, page by page"""
+        url = f"{DITTO_API_URL}/api/2/search/things"
+        cursor = None
+        while True:
+            option = f"size({SEARCH_PAGE_SIZE})" + (f",cursor({cursor})" if cursor else "")
+            with tracing.span('ditto.search', tracing.CLIENT, page_size=SEARCH_PAGE_SIZE) as span:
+                response = self.session.get(url, params={'filter': THING_FILTER, 'fields': THING_FIELDS,
+                                                         'option': option},
+                                            auth=DITTO_CREDENTIALS, timeout=10)
+                span.set('http.status_code', response.status_code)
+                if response.status_code != 200:
+                    raise ConnectionError(f"thing search returned {response.status_code}")
+                with tracing.span('json.decode', bytes=len(response.content)):
+                    page = response.json()
+            for item in page.get('items', []):
+                yield (item['thingId'], item.get('features', {}).get('temp', {}).get('properties', {}),
+                       {'policyId': item.get('policyId'), 'attributes': item.get('attributes')})
+            cursor = page.get('cursor')
+            if not cursor:
+                return
+    
+    def publish_health(self, health):
+        """Publish the system health if it changed"""
+        if {k: v for k, v in self.published_health.items() if k != 'timestamp'} != \
+                {k: v for k, v in health.items() if k != 'timestamp'}:
+            self.published_health = health
+            self.bus.publish({'health': health})
+    
+    def publish_full(self):
+        """Publish the poller's whole state, for workers that joined or fell behind"""
+        self.full_sync_pending = False
+        changes = {}
+        for row in self.polled.rows():
+            changes[row.pop('thingId')] = row
+        meta = {thing_id: self.polled.meta(thing_id) for thing_id in changes}
+        self.bus.publish({'full': True, 'changes': changes, 'meta': meta, 'health': self.published_health})
+    
+    def full_refresh(self):
+        """Re-read every matching thing through the search API and publish what changed"""
+        seen = set()
+        changed = {}
+        meta_changed = {}
+        with tracing.span('poll.refresh') as span:
+            for thing_id, properties, meta in self.search_things():
+                seen.add(thing_id)
+                changes = self.polled.update(thing_id, properties, replace=True)
+                if changes:
+                    changed[thing_id] = changes
+                if self.polled.update_meta(thing_id, meta, replace=True):
+                    meta_changed[thing_id] = self.polled.meta(thing_id)
+            removed = [t for t in self.polled.index if t not in seen]
+            for thing_id in removed:
+                self.polled.remove(thing_id)
+            span.set('things', len(seen))
+            span.set('changed', len(changed))
+        if self.full_sync_pending:
+            self.publish_full()
+        elif changed or meta_changed or removed:
+            self.bus.publish({'changes': changed, 'meta': meta_changed, 'removed': removed})
+        
+        if THING_ID not in self.polled and not self.default_thing_ready:
+            self.default_thing_ready = self.ensure_thing_exists()
+        return changed
+    
     def update_data(self):
-        """Update all data and emit to clients"""
+        """Update all data and emit changed things to clients"""
         try:
-            # Get current data
-            thing_data = self.get_thing_data()
-            temp_data = self.get_temperature_data()
-            health_data = self.get_system_health()
-            
-            # Store current data
-            self.current_data = {
-                'thing': thing_data or {},
-                'temperature': temp_data or {},
-                'health': health_data or {}
-            }
-            
-            # Add to historical data (keep last 100 points)
-            if temp_data and 'value' in temp_data:
-                self.historical_data.append({
-                    'value': temp_data['value'],
-                    'timestamp': temp_data.get('timestamp', datetime.now().isoformat()),
-                    'time': datetime.now().strftime('%H:%M:%S')
-                })
-                
-                if len(self.historical_data) > 100:
-                    self.historical_data.pop(0)
-            
-            # Always emit data, even if some parts are missing
-            emit_data = {
-                'thingId': thing_data.get('thingId', '') if thing_data else '',
-                'policyId': thing_data.get('policyId', '') if thing_data else '',
-                'features': {
-                    'temp': {
-                        'properties': temp_data or {}
-                    }
-                },
-                'attributes': thing_data.get('attributes', {}) if thing_data else {},
-                'health': health_data or {},
-                'historical': self.historical_data[-20:]  # Last 20 points
-            }
-            
-            # Emit to all connected clients (broadcast is automatic from background thread)
-            socketio.emit('data_update', emit_data)
-            logger.debug(f"Emitted data update: {emit_data.get('features', {}).get('temp', {}).get('properties', {})}")
-            
+            started = time.time()
+            with tracing.span('poll.cycle'):
+                # The health check runs alongside the search, so a cycle takes as long as the slower of the two;
+                # green threads start with an empty context, so its span gets the cycle as parent explicitly
+                health = eventlet.spawn(self.get_system_health, tracing.current())
+                changed = self.full_refresh()
+                self.publish_health(health.wait())
+            self.last_poll_seconds = time.time() - started
+            logger.debug(f"Refreshed {len(self.polled)} things in {self.last_poll_seconds:.3f}s, {len(changed)} changed")
         except Exception as e:
             logger.error(f"Error updating data: {e}", exc_info=True)
             # Emit error to clients
-            socketio.emit('data_update', {
-                'error': True,
-                'message': str(e)
-            })
+            self.bus.publish({'error': str(e)})
+    
+    def apply_event(self, change):
+        """Merge one change event from the stream into the thing's row and publish the change"""
+        thing_id = change.get('thingId')
+        if not thing_id:
+            return
+        properties = (change.get('features') or {}).get('temp', {}).get('properties')
+        with tracing.span('sse.event', thing_id=thing_id):
+            message = {}
+            if isinstance(properties, dict):
+                changes = self.polled.update(thing_id, properties)
+                if changes:
+                    message['changes'] = {thing_id: changes}
+            if ('policyId' in change or 'attributes' in change) and self.polled.update_meta(thing_id, change):
+                message['meta'] = {thing_id: self.polled.meta(thing_id)}
+            if message:
+                self.bus.publish(message)
+    
+    def stream_events(self):
+        """Follow the server-sent events of all matching things until the stream ends"""
+        url = f"{DITTO_API_URL}/api/2/things"
+        with self.session.get(url, params={'filter': THING_FILTER, 'fields': THING_FIELDS},
+                              auth=DITTO_CREDENTIALS, headers={'Accept': 'text/event-stream'},
+                              stream=True, timeout=(5, SSE_READ_TIMEOUT)) as response:
+            if response.status_code != 200:
+                raise ConnectionError(f"event stream returned {response.status_code}")
+            
+            # Fetch the full state only now, so no change slips in between fetch and subscription
+            self.publish_health(self.stream_health())
+            self.full_refresh()
+            logger.info(f"Subscribed to change events of {len(self.polled)} things matching {THING_FILTER}")
+            
+            data_lines = []
+            for line in response.iter_lines(decode_unicode=True):
+                if not self.running:
+                    break
+                if line:
+                    if line.startswith('data:'):
+                        value = line[5:]
+                        data_lines.append(value[1:] if value.startswith(' ') else value)
+                    continue  # comments (keep-alives), event and id fields are ignored
+                # A blank line completes an event; Ditto sends empty ones as heartbeats
+                if data_lines:
+                    self.apply_event(json.loads('\n'.join(data_lines)))
+                    data_lines = []
+    
+    def poll_loop(self):
+        next_poll = time.time()
+        while self.running:
+            self.update_data()
+            # Poll every second on a fixed schedule; a slow cycle is followed by the next one at once
+            next_poll = max(next_poll + POLL_INTERVAL, time.time())
+            time.sleep(next_poll - time.time())
+    
+    def stream_loop(self):
+        delay = 1
+        while self.running:
+            connected_at = time.time()
+            try:
+                self.stream_events()
+                logger.warning("Event stream closed by Ditto, reconnecting...")
+            except Exception as e:
+                logger.warning(f"Event stream interrupted: {e}, reconnecting...")
+                # Show the outage instead of the stale stream health
+                self.publish_health(self.get_system_health())
+            # Reconnect at once after a healthy stream, back off exponentially while Ditto keeps failing
+            if time.time() - connected_at > RECONNECT_DELAY_MAX:
+                delay = 1
+                continue
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_DELAY_MAX)
+    
+    def coordinate(self):
+        """Compete to become the poller; once elected, poll Ditto and answer full sync requests"""
+        while self.running:
+            if self.election.try_acquire(self.worker_id):
+                if not self.is_poller:
+                    logger.info(f"Worker {self.worker_id} elected to poll Ditto ({UPDATE_MODE})")
+                    self.is_poller = True
+                    # Start from scratch and publish everything after the first refresh
+                    self.polled = ThingTable()
+                    self.full_sync_pending = True
+                    self.synced = self.bus.sync_requests()
+                    socketio.start_background_task(self.stream_loop if UPDATE_MODE == 'sse' else self.poll_loop)
+                syncs = self.bus.sync_requests()
+                if syncs != self.synced and not self.full_sync_pending:
+                    self.synced = syncs
+                    self.publish_full()
+            time.sleep(ELECTION_INTERVAL)
+    
+    def push_fleet_stats(self):
+        """Send the fleet statistics to this worker's clients every STATS_INTERVAL"""
+        while self.running:
+            time.sleep(STATS_INTERVAL)
+            if outboxes.boxes:
+                outboxes.broadcast('fleet_stats', 'fleet_stats', self.stats.fleet_summary())
     
     def start_monitoring(self):
-        """Start the monitoring thread"""
-        def monitor_loop():
-            while self.running:
-                self.update_data()
-                time.sleep(1)  # Update every 1 second for real-time updates
-        
-        monitor_thread = threading.Thread(target=monitor_loop, daemon=True)
-        monitor_thread.start()
-        logger.info("Digital Twin monitoring started")
+        """Start following the bus and competing for the poller role"""
+        self.bus.subscribe(self.apply)
+        socketio.start_background_task(self.bus.run)
+        self.bus.request_sync()
+        socketio.start_background_task(self.coordinate)
+        socketio.start_background_task(self.push_fleet_stats)
+        logger.info(f"Digital Twin monitoring started in worker {self.worker_id}")
+
+# Outbound queues of this worker's clients
+outboxes = Outboxes(socketio, OUTBOX_MAX_FRAMES, OUTBOX_IN_FLIGHT)
+
+# Initialize monitor; pre-forked workers replace it with one on the shared bus
+monitor = DigitalTwinMonitor(LocalBus(), LocalElection())
+
+# Serialized responses, rebuilt only when the version of the state behind them changes
+snapshots = SnapshotCache()
 
-# Initialize monitor
-monitor = DigitalTwinMonitor()
+def thing_or_404(thing_id):
+    """Return a thing's (version, temp properties), aborting with 404 if it is not monitored"""
+    snapshot = monitor.things.snapshot(thing_id)
+    if snapshot is None:
+        abort(404, description=f"Thing {thing_id} is not monitored")
+    return snapshot
 
 @app.route('/')
 def index():
     """Main dashboard page"""
-    return render_template('dashboard.html', thing_id=THING_ID)
+    # Without sticky sessions, clients of several workers must not fall back to long-polling
+    socket_options = {'transports': ['websocket']} if WORKERS > 1 else {}
+    return render_template('dashboard.html', thing_id=request.args.get('thing', THING_ID),
+                           socket_options=socket_options, stats_window=next(iter(STATS_WINDOWS)),
+                           socketio_serializer=SOCKETIO_SERIALIZER)
+
+@app.route('/api/things')
+def api_things():
+    """API endpoint listing the latest temperature of every monitored thing"""
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    snapshot = snapshots.get(('things', offset, limit), monitor.things.sequence,
+                             lambda: {'total': len(monitor.things), 'things': monitor.things.rows(offset, limit)})
+    return snapshot.response(request)
 
 @app.route('/api/thing')
-def api_thing():
-    """API endpoint for thing data"""
-    return jsonify(monitor.current_data.get('thing', {}))
+@app.route('/api/things/<thing_id>')
+def api_thing(thing_id=THING_ID):
+    """API endpoint for thing data; /api/thing serves the default thing"""
+    version, properties = thing_or_404(thing_id)
+    meta = monitor.things.meta(thing_id) or {'policyId': '', 'attributes': {}}
+    snapshot = snapshots.get(('thing', thing_id), version,
+                             lambda: {'thingId': thing_id, 'policyId': meta['policyId'],
+                                      'attributes': meta['attributes'], 'features': {'temp': {'properties': properties}}})
+    return snapshot.response(request)
 
-@app.route('/api/temperature')
-def api_temperature():
+@app.route('/api/things/<thing_id>/temperature')
+def api_temperature(thing_id=THING_ID):
     """API endpoint for temperature data"""
-    return jsonify(monitor.current_data.get('temperature', {}))
+    version, properties = thing_or_404(thing_id)
+    return snapshots.get(('temperature', thing_id), version, lambda: properties).response(request)
+
+@app.route('/api/things/<thing_id>/historical')
+def api_historical(thing_id=THING_ID):
+    """API endpoint for historical data, optionally a from/to range downsampled to max_points"""
+    version, _ = thing_or_404(thing_id)
+    try:
+        start = parse_timestamp(request.args['from']) if 'from' in request.args else None
+        end = parse_timestamp(request.args['to']) if 'to' in request.args else None
+    except ValueError:
+        abort(400, description="from and to must be epoch seconds, epoch milliseconds or ISO 8601")
+    max_points = request.args.get('max_points', type=int)
+    method = request.args.get('method', 'lttb')
+    if method not in DOWNSAMPLERS:
+        abort(400, description=f"method must be one of {', '.join(DOWNSAMPLERS)}")
+    
+    def build():
+        points = monitor.history.query(thing_id, start, end, max_points, method)
+        return [format_point(ts, value) for ts, value in points]
+    
+    snapshot = snapshots.get(('historical', thing_id, request.query_string), version, build)
+    # A range that ended in the past is settled, clients may reuse it for a while
+    settled = end is not None and end < time.time() - HISTORY_SETTLE_SECONDS
+    return snapshot.response(request, 'max-age=60' if settled else 'no-cache')
+
+def stats_windows():
+    """The windows named by ?window= (repeatable), all configured ones by default"""
+    windows = request.args.getlist('window')
+    unknown = [w for w in windows if w not in STATS_WINDOWS]
+    if unknown:
+        abort(400, description=f"window must be one of {', '.join(STATS_WINDOWS)}")
+    return windows or None
+
+def stats_version():
+    """Statistics change with every sample and as the windows slide, rebuild at most once a second"""
+    return monitor.stats.samples, int(time.time())
+
+@app.route('/api/stats')
+def api_stats():
+    """API endpoint for the fleet statistics and a page of per-thing statistics"""
+    windows = stats_windows()
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    
+    def build():
+        thing_ids = sorted(monitor.stats.things)
+        end = None if limit is None else offset + limit
+        return {
+            'windows': {name: STATS_WINDOWS[name] for name in windows or STATS_WINDOWS},
+            'fleet': monitor.stats.fleet_summary(windows),
+            'total': len(thing_ids),
+            'things': {thing_id: monitor.stats.thing(thing_id, windows) for thing_id in thing_ids[offset:end]}
+        }
+    
+    return snapshots.get(('stats', request.query_string), stats_version(), build).response(request)
+
+@app.route('/api/things/<thing_id>/stats')
+def api_thing_stats(thing_id):
+    """API endpoint for the statistics of one thing"""
+    thing_or_404(thing_id)
+    windows = stats_windows()
+    snapshot = snapshots.get(('thing_stats', thing_id, request.query_string), stats_version(),
+                             lambda: {'thingId': thing_id, 'stats': monitor.stats.thing(thing_id, windows) or {}})
+    return snapshot.response(request)
+
+# The unscoped endpoints keep serving the default thing
+app.add_url_rule('/api/thing', 'api_default_thing', api_thing)
+app.add_url_rule('/api/temperature', 'api_default_temperature', api_temperature)
+app.add_url_rule('/api/historical', 'api_default_historical', api_historical)
 
 @app.route('/api/health')
 def api_health():
     """API endpoint for system health"""
-    return jsonify(monitor.current_data.get('health', {}))
+    return snapshots.get(('health',), monitor.health_version, lambda: monitor.health).response(request)
 
-@app.route('/api/historical')
-def api_historical():
-    """API endpoint for historical data"""
-    return jsonify(monitor.historical_data)
+@app.route('/api/clients')
+def api_clients():
+    """API endpoint for the send queue, lag and coalesced/dropped updates of this worker's clients"""
+    return jsonify(outboxes.metrics())
+
+@app.route('/admin/profile')
+def admin_profile():
+    """Sample this worker's stacks for ?seconds= every ?interval= ms, as folded stacks for a flame graph"""
+    # Header only, query strings end up in access logs and browser history
+    token = request.headers.get('X-Admin-Token', '')
+    if not ADMIN_TOKEN or not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        abort(404)
+    seconds = request.args.get('seconds', 10.0, type=float)
+    interval = request.args.get('interval', 5.0, type=float)
+    if not 0 < seconds <= tracing.MAX_PROFILE_SECONDS or not 0 < interval <= 1000:
+        abort(400, description=f"seconds must be in (0, {tracing.MAX_PROFILE_SECONDS}] and interval in (0, 1000] ms")
+    stacks = tracing.PROFILER.profile(seconds, interval / 1000)
+    if stacks is None:
+        abort(409, description="a profile is already running")
+    return stacks, 200, {'Content-Type': 'text/plain; charset=utf-8'}
 
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
+    outboxes.open(request.sid)
     logger.info('Client connected')
     emit('connected', {'message': 'Connected to Digital Twin Dashboard'})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
+    monitor.drop_client(request.sid)
+    outboxes.close(request.sid)
     logger.info('Client disconnected')
 
+@socketio.on('subscribe')
+def handle_subscribe(message=None):
+    """Follow a thing, starting from its full snapshot; clients also resubscribe after a version gap"""
+    thing_id = (message or {}).get('thingId') or THING_ID
+    monitor.subscribe(request.sid, thing_id)
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(message=None):
+    """Stop following a thing"""
+    thing_id = (message or {}).get('thingId') or THING_ID
+    monitor.unsubscribe(request.sid, thing_id)
+
 @socketio.on('request_data')
-def handle_request_data():
-    """Handle data request from client"""
+def handle_request_data(message=None):
+    """Handle data request from client, for the thing it names or the default one"""
     try:
-        thing_data = monitor.current_data.get('thing', {})
-        temp_data = monitor.current_data.get('temperature', {})
-        health_data = monitor.current_data.get('health', {})
-        
-        emit_data = {
-            'thingId': thing_data.get('thingId', '') if thing_data else '',
-            'policyId': thing_data.get('policyId', '') if thing_data else '',
-            'features': {
-                'temp': {
-                    'properties': temp_data if temp_data else {}
-                }
-            },
-            'attributes': thing_data.get('attributes', {}) if thing_data else {},
-            'health': health_data if health_data else {},
-            'historical': monitor.historical_data[-20:] if monitor.historical_data else []
-        }
-        
+        thing_id = (message or {}).get('thingId') or THING_ID
+        emit_data = monitor.build_emit_data(thing_id)
         emit('data_update', emit_data)
         logger.debug(f"Sent data to client: {emit_data.get('features', {}).get('temp', {}).get('properties', {})}")
     except Exception as e:
         logger.error(f"Error handling request_data: {e}", exc_info=True)
         emit('data_update', {'error': True, 'message': str(e)})
 
-if __name__ == '__main__':
-    # Start monitoring
+def run_worker(listener, bus):
+    """Serve clients from one pre-forked worker process"""
+    global monitor
+    monitor = DigitalTwinMonitor(bus, FileLockElection(POLLER_LOCK_PATH))
     monitor.start_monitoring()
+    try:
+        eventlet.wsgi.server(listener, app, log_output=False)
+    finally:
+        monitor.history.close()
+        # Workers leave through os._exit(), which skips atexit
+        tracing.flush()
+
+def serve_workers(count):
+    """Pre-fork count workers sharing one listening socket, one shared-memory bus and one poller lock"""
+    listener = eventlet.listen(('0.0.0.0', PORT))
+    bus = SharedMemoryBus(SHARED_BUS_BYTES)
+    workers = set()
     
-    # Start Flask app
-    logger.info("Starting Digital Twin Dashboard...")
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True)
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(listener, bus)
+            finally:
+                os._exit(1)
+        workers.add(pid)
+    
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    for _ in range(count):
+        spawn()
+    logger.info(f"Serving on :{PORT} with {count} workers")
+    try:
+        while True:
+            pid, status = os.wait()
+            if pid in workers:
+                workers.discard(pid)
+                logger.warning(f"Worker {pid} exited with status {status}, starting a new one")
+                time.sleep(1)
+                spawn()
+    finally:
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+        bus.close()
+
+if __name__ == '__main__':
+    if WORKERS > 1:
+        serve_workers(WORKERS)
+    else:
+        # Start monitoring
+        monitor.start_monitoring()
+        
+        # Start Flask app
+        logger.info("Starting Digital Twin Dashboard...")
+        try:
+            socketio.run(app, host='0.0.0.0', port=PORT, debug=True)
+        finally:
+            monitor.history.close()
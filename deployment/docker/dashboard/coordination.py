@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Coordination between dashboard workers
+One elected worker polls Ditto and publishes state changes on a bus that every worker applies
+
+A bus offers publish(message), subscribe(handler), run() (delivery loop, if it needs one),
+request_sync() and sync_requests(). An election offers try_acquire(worker_id) and release(worker_id).
+The local implementations serve a single process and tests; the shared-memory bus and the
+file-lock election serve several worker processes on one host.
+"""
+
+import os
+import json
+import time
+import fcntl
+import struct
+import logging
+from multiprocessing import shared_memory
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+READ_INTERVAL = 0.02
+
+
+class LocalBus:
+    """In-process bus: publish() hands each message straight to the subscribers"""
+
+    def __init__(self):
+        self.handlers = []
+        self.syncs = 0
+
+    def subscribe(self, handler):
+        self.handlers.append(handler)
+
+    def publish(self, message):
+        with tracing.span('bus.publish', bus='local'):
+            for handler in self.handlers:
+                handler(message)
+
+    def run(self):
+        pass  # delivery happens inside publish()
+
+    def request_sync(self):
+        self.syncs += 1
+
+    def sync_requests(self):
+        return self.syncs
+
+
+class SharedMemoryBus:
+    """Single-host bus: the poller appends JSON frames to a ring in a shared-memory segment
+
+    The header holds the total bytes ever written and a sync request counter. Each worker reads
+    frames from its own position up to the written mark; a reader the writer has lapped skips
+    ahead and asks for a full state sync instead. Create it before forking the workers."""
+
+    HEADER = struct.Struct('<QQ')
+    FRAME = struct.Struct('<I')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(create=True, size=self.HEADER.size + capacity)
+        self.owner_pid = os.getpid()
+        self.buffer = self.shm.buf
+        self.HEADER.pack_into(self.buffer, 0, 0, 0)
+        self.handlers = []
+        self.position = None
+
+    def written(self):
+        return self.HEADER.unpack_from(self.buffer, 0)[0]
+
+    def copy_in(self, offset, data):
+        start = self.HEADER.size + offset % self.capacity
+        first = min(len(data), self.HEADER.size + self.capacity - start)
+        self.buffer[start:start + first] = data[:first]
+        if first < len(data):
+            self.buffer[self.HEADER.size:self.HEADER.size + len(data) - first] = data[first:]
+
+    def copy_out(self, offset, length):
+        start = self.HEADER.size + offset % self.capacity
+        first = min(length, self.HEADER.size + self.capacity - start)
+        data = bytes(self.buffer[start:start + first])
+        if first < length:
+            data += bytes(self.buffer[self.HEADER.size:self.HEADER.size + length - first])
+        return data
+
+    def publish(self, message):
+        with tracing.span('bus.publish', bus='shared-memory') as span:
+            payload = json.dumps(message, separators=(',', ':')).encode('utf-8')
+            frame = self.FRAME.pack(len(payload)) + payload
+            span.set('bytes', len(frame))
+            if len(frame) > self.capacity:
+                raise ValueError(f"message of {len(frame)} bytes does not fit the {self.capacity} byte bus")
+            written = self.written()
+            self.copy_in(written, frame)
+            # Frames become visible to readers only once the written mark moves past them
+            struct.pack_into('<Q', self.buffer, 0, written + len(frame))
+
+    def subscribe(self, handler):
+        self.handlers.append(handler)
+        if self.position is None:
+            self.position = self.written()
+
+    def lapped(self, start):
+        """Whether the writer has overwritten data at start since we began reading it"""
+        if self.written() - start > self.capacity:
+            logger.warning("Fell behind the shared-memory bus, requesting a full sync")
+            self.position = self.written()
+            self.request_sync()
+            return True
+        return False
+
+    def poll(self):
+        """Deliver every complete frame written since the last poll"""
+        written = self.written()
+        while self.position < written:
+            start = self.position
+            if self.lapped(start):
+                return
+            (length,) = self.FRAME.unpack(self.copy_out(start, self.FRAME.size))
+            payload = self.copy_out(start + self.FRAME.size, length)
+            if self.lapped(start):
+                return
+            self.position = start + self.FRAME.size + length
+            message = json.loads(payload)
+            for handler in self.handlers:
+                handler(message)
+
+    def run(self):
+        while True:
+            self.poll()
+            time.sleep(READ_INTERVAL)
+
+    def request_sync(self):
+        # Concurrent increments may collapse into one; any change is a request
+        struct.pack_into('<Q', self.buffer, 8, self.sync_requests() + 1)
+
+    def sync_requests(self):
+        return self.HEADER.unpack_from(self.buffer, 0)[1]
+
+    def close(self):
+        self.buffer.release()
+        self.shm.close()
+        if os.getpid() == self.owner_pid:
+            self.shm.unlink()
+
+
+class LocalElection:
+    """In-process election: the first worker to ask leads until it releases"""
+
+    def __init__(self):
+        self.leader = None
+
+    def try_acquire(self, worker_id):
+        if self.leader in (None, worker_id):
+            self.leader = worker_id
+            return True
+        return False
+
+    def release(self, worker_id):
+        if self.leader == worker_id:
+            self.leader = None
+
+
+class FileLockElection:
+    """Single-host election through an exclusive flock; the kernel frees it when the leader dies"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def try_acquire(self, worker_id):
+        if self.fd is not None:
+            return True
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, worker_id.encode('utf-8'))
+        self.fd = fd
+        return True
+
+    def release(self, worker_id):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Time-series history for the Digital Twin Dashboard
+Per-thing ring buffers for the recent window, SQLite for days of data, downsampling for charts
+"""
+
+import time
+import sqlite3
+import logging
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 1.0
+FLUSH_ROWS = 5000
+PRUNE_INTERVAL = 3600
+ROLLUP_SECONDS = 60
+
+
+def parse_timestamp(raw):
+    """Parse epoch seconds, epoch milliseconds or ISO 8601 into epoch seconds"""
+    try:
+        value = float(raw)
+        return value / 1000 if value > 1e11 else value
+    except (TypeError, ValueError):
+        parsed = datetime.fromisoformat(str(raw).replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+
+class RingBuffer:
+    """Fixed-size buffer of (epoch seconds, value) samples backed by two float arrays"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, timestamp, value):
+        end = (self.start + self.size) % self.capacity
+        self.times[end] = timestamp
+        self.values[end] = value
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def oldest(self):
+        return self.times[self.start] if self.size else None
+
+    def newest(self):
+        return self.times[(self.start + self.size - 1) % self.capacity] if self.size else None
+
+    def items(self, count=None):
+        """Return the last count samples (all by default), oldest first"""
+        count = self.size if count is None else min(count, self.size)
+        first = self.start + self.size - count
+        return [(self.times[i % self.capacity], self.values[i % self.capacity])
+                for i in range(first, first + count)]
+
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets downsampling of time-ordered (x, y) points"""
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return points
+    sampled = [points[0]]
+    bucket = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket) + 1
+        end = int((i + 1) * bucket) + 1
+        # The average of the next bucket is the third corner of the triangle
+        next_end = min(int((i + 2) * bucket) + 1, n)
+        following = points[end:next_end]
+        avg_x = sum(p[0] for p in following) / len(following)
+        avg_y = sum(p[1] for p in following) / len(following)
+        ax, ay = points[a]
+        best_area = -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best_area, a = area, j
+        sampled.append(points[a])
+    sampled.append(points[-1])
+    return sampled
+
+
+def min_max(points, threshold):
+    """Keep the minimum and maximum of each of threshold/2 buckets, in time order"""
+    n = len(points)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return points
+    sampled = []
+    for i in range(buckets):
+        bucket = points[i * n // buckets:(i + 1) * n // buckets]
+        low = min(bucket, key=lambda p: p[1])
+        high = max(bucket, key=lambda p: p[1])
+        sampled.extend(sorted({low, high}))
+    return sampled
+
+
+DOWNSAMPLERS = {'lttb': lttb, 'minmax': min_max}
+
+
+class HistoryStore:
+    def __init__(self, path, hot_points=300, retention_days=2):
+        """Keep hot_points samples per thing in memory and persist all samples to path ('' = memory only)"""
+        self.path = path
+        self.hot_points = hot_points
+        self.retention_days = retention_days
+        self.retention = retention_days * 86400
+        self.rings = {}
+        self.pending = []
+        self.last_flush = time.time()
+        self.last_prune = 0
+        self.thing_keys = {}
+        self.lock = threading.Lock()
+        self.connection = None
+
+    @property
+    def db(self):
+        """The SQLite connection, opened on first use so no connection is inherited across fork()"""
+        if self.connection is None and self.path:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS things (key INTEGER PRIMARY KEY, thing_id TEXT UNIQUE)")
+            # Clustered on (thing, ts) so a range query is one contiguous index scan; ts is the arrival time
+            # of a sample, so two samples of a thing share one only if they arrived at the same instant,
+            # and then the later one replaces the earlier (INSERT OR REPLACE)
+            db.execute("CREATE TABLE IF NOT EXISTS samples (thing INTEGER, ts REAL, value REAL, "
+                       "PRIMARY KEY (thing, ts)) WITHOUT ROWID")
+            # Per-minute extremes, so long ranges are downsampled from a day's 1440 rows, not 86k samples
+            db.execute("CREATE TABLE IF NOT EXISTS rollups (thing INTEGER, minute INTEGER, "
+                       "min_ts REAL, min_value REAL, max_ts REAL, max_value REAL, "
+                       "PRIMARY KEY (thing, minute)) WITHOUT ROWID")
+            db.commit()
+            self.thing_keys = dict(db.execute("SELECT thing_id, key FROM things"))
+            self.connection = db
+            logger.info(f"History persisted to {self.path} for {self.retention_days} days")
+        return self.connection
+
+    def append(self, thing_id, timestamp, value, persist=True):
+        """Record one sample; persisted in batches unless persist is off (another worker writes it)
+
+        Samples of a thing must arrive in time order; one older than the last (clock stepped back) is
+        stamped with the last one's time, so ring buffers stay sorted for range lookups."""
+        ring = self.rings.get(thing_id)
+        if ring is None:
+            ring = self.rings[thing_id] = RingBuffer(self.hot_points)
+        elif ring.size and timestamp < ring.newest():
+            timestamp = ring.newest()
+        ring.append(timestamp, value)
+        if self.path and persist:
+            with self.lock:
+                self.pending.append((thing_id, timestamp, value))
+                due = len(self.pending) >= FLUSH_ROWS or time.time() - self.last_flush >= FLUSH_INTERVAL
+            if due:
+                self.flush()
+
+    def recent(self, thing_id, count=None):
+        """Return the last count samples of a thing from memory"""
+        ring = self.rings.get(thing_id)
+        return ring.items(count) if ring else []
+
+    def thing_key(self, thing_id):
+        key = self.thing_keys.get(thing_id)
+        if key is None:
+            cursor = self.db.execute("INSERT OR IGNORE INTO things (thing_id) VALUES (?)", (thing_id,))
+            # An ignored insert leaves lastrowid pointing at some earlier row
+            if cursor.rowcount == 1:
+                key = cursor.lastrowid
+            else:
+                key = self.db.execute("SELECT key FROM things WHERE thing_id = ?", (thing_id,)).fetchone()[0]
+            self.thing_keys[thing_id] = key
+        return key
+
+    def flush(self):
+        """Write buffered samples to SQLite in one transaction"""
+        if not self.path:
+            return
+        db = self.db
+        with self.lock:
+            rows, self.pending = self.pending, []
+            self.last_flush = time.time()
+            if rows:
+                with tracing.span('history.flush', rows=len(rows)):
+                    samples = [(self.thing_key(thing_id), ts, value) for thing_id, ts, value in rows]
+                    db.executemany("INSERT OR REPLACE INTO samples (thing, ts, value) VALUES (?, ?, ?)", samples)
+                    db.executemany(
+                        "INSERT INTO rollups (thing, minute, min_ts, min_value, max_ts, max_value) "
+                        "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (thing, minute) DO UPDATE SET "
+                        "min_ts = CASE WHEN excluded.min_value < min_value THEN excluded.min_ts ELSE min_ts END, "
+                        "min_value = min(min_value, excluded.min_value), "
+                        "max_ts = CASE WHEN excluded.max_value > max_value THEN excluded.max_ts ELSE max_ts END, "
+                        "max_value = max(max_value, excluded.max_value)", self.rollup(samples))
+            if self.last_flush - self.last_prune >= PRUNE_INTERVAL:
+                self.last_prune = self.last_flush
+                cutoff = self.last_flush - self.retention
+                db.execute("DELETE FROM samples WHERE ts < ?", (cutoff,))
+                db.execute("DELETE FROM rollups WHERE minute < ?", (int(cutoff // ROLLUP_SECONDS),))
+            db.commit()
+
+    @staticmethod
+    def rollup(samples):
+        """Reduce (thing, ts, value) samples to per-minute extremes"""
+        minutes = {}
+        for thing, ts, value in samples:
+            key = (thing, int(ts // ROLLUP_SECONDS))
+            extremes = minutes.get(key)
+            if extremes is None:
+                minutes[key] = [ts, value, ts, value]
+            elif value < extremes[1]:
+                extremes[0], extremes[1] = ts, value
+            elif value > extremes[3]:
+                extremes[2], extremes[3] = ts, value
+        return [key + tuple(extremes) for key, extremes in minutes.items()]
+
+    def forget(self, thing_id):
+        """Drop a thing's in-memory samples; persisted ones age out with the retention"""
+        self.rings.pop(thing_id, None)
+
+    def query(self, thing_id, start=None, end=None, max_points=None, method='lttb'):
+        """Return the samples of a thing between start and end, downsampled to at most max_points"""
+        ring = self.rings.get(thing_id)
+        oldest = ring.oldest() if ring else None
+        if start is None or not self.path or (oldest is not None and start >= oldest):
+            # Served from memory when the range is inside the hot window
+            points = ring.items() if ring else []
+            times = [p[0] for p in points]
+            low = 0 if start is None else bisect_left(times, start)
+            high = len(points) if end is None else bisect_right(times, end)
+            points = points[low:high]
+        else:
+            self.flush()
+            key = self.thing_keys.get(thing_id)
+            if key is None:
+                # The thing may have been stored by another worker since we loaded the keys
+                row = self.db.execute("SELECT key FROM things WHERE thing_id = ?", (thing_id,)).fetchone()
+                if row is None:
+                    return []
+                key = self.thing_keys[thing_id] = row[0]
+            end = time.time() if end is None else end
+            with self.lock:
+                if max_points and (end - start) / max_points >= ROLLUP_SECONDS:
+                    points = set()
+                    for min_ts, min_value, max_ts, max_value in self.db.execute(
+                            "SELECT min_ts, min_value, max_ts, max_value FROM rollups "
+                            "WHERE thing = ? AND minute BETWEEN ? AND ?",
+                            (key, int(start // ROLLUP_SECONDS), int(end // ROLLUP_SECONDS))):
+                        points.add((min_ts, min_value))
+                        points.add((max_ts, max_value))
+                    points = sorted(p for p in points if start <= p[0] <= end)
+                else:
+                    points = self.db.execute("SELECT ts, value FROM samples WHERE thing = ? AND ts BETWEEN ? AND ? "
+                                             "ORDER BY ts", (key, start, end)).fetchall()
+        if max_points:
+            points = DOWNSAMPLERS[method](points, max_points)
+        return points
+
+    def close(self):
+        if self.connection is not None:
+            self.flush()
+            self.connection.close()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Per-client outbound queues for the Digital Twin Dashboard
+Updates are queued per client and sent by one task per client, so a slow browser only delays itself
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+import tracing
+
+SEND_CHECK_INTERVAL = 0.01
+
+
+class Outbox:
+    """Frames waiting for one client, at most one per key
+
+    A frame queued under a key that is still pending replaces the pending one (or is merged into
+    it), so a client that cannot keep up skips stale states instead of building a backlog."""
+
+    def __init__(self, sid, max_frames):
+        self.sid = sid
+        self.max_frames = max_frames
+        self.pending = OrderedDict()
+        self.ready = threading.Event()
+        self.open = True
+        self.connected_at = time.time()
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.last_lag = 0.0
+
+    def put(self, key, event, payload, merge=None):
+        """Queue a frame; merge(event, payload, new payload) combines it with a pending one of the same key"""
+        frame = self.pending.get(key)
+        if frame is not None:
+            self.coalesced += 1
+            if merge is not None:
+                event, payload = merge(frame[0], frame[1], payload)
+            # Keeps its place in the queue and the age of the oldest state it carries
+            self.pending[key] = (event, payload, frame[2])
+        else:
+            if len(self.pending) >= self.max_frames:
+                self.pending.popitem(last=False)
+                self.dropped += 1
+            self.pending[key] = (event, payload, time.time())
+        self.ready.set()
+
+    def take(self):
+        """Remove and return the oldest frame as (event, payload, queued at), or None"""
+        if not self.pending:
+            self.ready.clear()
+            return None
+        return self.pending.popitem(last=False)[1]
+
+    def lag(self):
+        """Seconds the oldest pending frame has been waiting"""
+        if not self.pending:
+            return 0.0
+        return time.time() - next(iter(self.pending.values()))[2]
+
+    def metrics(self):
+        return {
+            'sid': self.sid,
+            'pending': len(self.pending),
+            'lagSeconds': round(self.lag(), 3),
+            'lastLagSeconds': round(self.last_lag, 3),
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'connectedSeconds': round(time.time() - self.connected_at, 1)
+        }
+
+
+class Outboxes:
+    """The outboxes of all clients of a Socket.IO server, each drained by its own sender task"""
+
+    def __init__(self, socketio, max_frames=256, in_flight=2):
+        self.socketio = socketio
+        self.max_frames = max_frames
+        # Frames handed to the transport but not yet written to the client's socket
+        self.in_flight = in_flight
+        self.boxes = {}
+
+    def open(self, sid):
+        outbox = self.boxes[sid] = Outbox(sid, self.max_frames)
+        self.socketio.start_background_task(self.drain, outbox)
+
+    def close(self, sid):
+        outbox = self.boxes.pop(sid, None)
+        if outbox is not None:
+            outbox.open = False
+            outbox.ready.set()
+
+    def send(self, sid, key, event, payload, merge=None):
+        outbox = self.boxes.get(sid)
+        if outbox is not None:
+            outbox.put(key, event, payload, merge)
+
+    def broadcast(self, key, event, payload):
+        for outbox in list(self.boxes.values()):
+            outbox.put(key, event, payload)
+
+    def transport_backlog(self, sid):
+        """Packets queued in the client's Engine.IO socket; None once the client is gone"""
+        server = self.socketio.server
+        eio_socket = server.eio.sockets.get(server.manager.eio_sid_from_sid(sid, '/'))
+        return None if eio_socket is None or eio_socket.closed else eio_socket.queue.qsize()
+
+    def drain(self, outbox):
+        """Send an outbox's frames, one at a time and only as fast as the client reads them"""
+        while outbox.open:
+            outbox.ready.wait()
+            while outbox.open:
+                backlog = self.transport_backlog(outbox.sid)
+                if backlog is None:
+                    self.close(outbox.sid)
+                    return
+                if backlog >= self.in_flight:
+                    # Meanwhile new states coalesce in the outbox
+                    time.sleep(SEND_CHECK_INTERVAL)
+                    continue
+                frame = outbox.take()
+                if frame is None:
+                    break
+                event, payload, queued_at = frame
+                with tracing.span('socketio.emit', event=event, lag=time.time() - queued_at):
+                    self.socketio.emit(event, payload, to=outbox.sid)
+                outbox.sent += 1
+                outbox.last_lag = time.time() - queued_at
+
+    def metrics(self):
+        clients = [outbox.metrics() for outbox in list(self.boxes.values())]
+        return {
+            'clients': clients,
+            'total': {
+                'clients': len(clients),
+                'pending': sum(c['pending'] for c in clients),
+                'maxLagSeconds': max((c['lagSeconds'] for c in clients), default=0.0),
+                'sent': sum(c['sent'] for c in clients),
+                'coalesced': sum(c['coalesced'] for c in clients),
+                'dropped': sum(c['dropped'] for c in clients)
+            }
+        }
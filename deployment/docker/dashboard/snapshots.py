@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Pre-serialized response snapshots for the Digital Twin Dashboard
+Each payload is serialized and compressed once per state change and served as bytes
+"""
+
+import gzip
+import json
+import hashlib
+from collections import OrderedDict
+
+from flask import Response
+
+import tracing
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+
+
+class Snapshot:
+    """An immutable serialized payload with its compressed variants, each under its own strong ETag"""
+
+    __slots__ = ('version', 'body', 'tag', 'encoded')
+
+    def __init__(self, version, payload):
+        self.version = version
+        self.body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        self.tag = hashlib.blake2b(self.body, digest_size=12).hexdigest()
+        self.encoded = {}
+        if len(self.body) >= COMPRESS_MIN_BYTES:
+            self.encoded['gzip'] = gzip.compress(self.body, compresslevel=5)
+            if brotli is not None:
+                self.encoded['br'] = brotli.compress(self.body, quality=5)
+
+    def variant_tag(self, encoding=None):
+        """Return the opaque tag of the body in a content-coding (None for identity)"""
+        return f"{self.tag}-{encoding}" if encoding else self.tag
+
+    def response(self, request, cache_control='no-cache'):
+        """Serve the snapshot, or 304 if the client already has it in any encoding"""
+        encoding = request.accept_encodings.best_match(list(self.encoded)) if self.encoded else None
+        headers = {'ETag': f'"{self.variant_tag(encoding)}"', 'Cache-Control': cache_control,
+                   'Vary': 'Accept-Encoding'}
+        variants = [None, *self.encoded]
+        if request.if_none_match.star_tag or any(request.if_none_match.contains_weak(self.variant_tag(variant))
+                                                 for variant in variants):
+            return Response(status=304, headers=headers)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+            return Response(self.encoded[encoding], mimetype='application/json', headers=headers)
+        return Response(self.body, mimetype='application/json', headers=headers)
+
+
+class SnapshotCache:
+    """Snapshots by key, rebuilt only when the version of the underlying state moves on"""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key, version, build):
+        """Return the snapshot of key at version, calling build() for the payload if it is stale"""
+        snapshot = self.entries.get(key)
+        if snapshot is None or snapshot.version != version:
+            with tracing.span('snapshot.build', key=str(key[0])):
+                snapshot = self.entries[key] = Snapshot(version, build())
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return snapshot
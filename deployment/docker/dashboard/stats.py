@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Streaming statistics for the Digital Twin Dashboard
+Sliding-window count, mean, stddev, min, max and percentiles per thing and across the fleet,
+updated in constant time per sample instead of rescanning the history
+"""
+
+import math
+import time
+import threading
+from collections import deque
+
+# Each window slides in steps of 1/PANES of its length
+PANES = 60
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+# Percentiles come from a log-bucketed sketch with this relative error (DDSketch mapping)
+RELATIVE_ACCURACY = 0.005
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+MIN_MAGNITUDE = 1e-9
+KEY_OFFSET = math.ceil(-math.log(MIN_MAGNITUDE) / LOG_GAMMA) + 1
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_windows(spec):
+    """Parse a window list such as '1m,15m,1h' into {name: seconds}"""
+    windows = {}
+    for name in (part.strip() for part in spec.split(',')):
+        if not name:
+            continue
+        if name[-1] in UNITS:
+            seconds = float(name[:-1]) * UNITS[name[-1]]
+        else:
+            seconds = float(name)
+        if seconds <= 0:
+            raise ValueError(f"window {name} must be positive")
+        windows[name] = seconds
+    return windows
+
+
+def bucket_key(value):
+    """Sketch bucket of a value; keys sort in the same order as the values they cover"""
+    magnitude = abs(value)
+    if magnitude < MIN_MAGNITUDE:
+        return 0
+    key = math.ceil(math.log(magnitude) / LOG_GAMMA) + KEY_OFFSET
+    return key if value > 0 else -key
+
+
+def bucket_value(key):
+    """The value representing a bucket, within RELATIVE_ACCURACY of everything in it"""
+    if key == 0:
+        return 0.0
+    magnitude = 2 * GAMMA ** (abs(key) - KEY_OFFSET) / (GAMMA + 1)
+    return magnitude if key > 0 else -magnitude
+
+
+class Pane:
+    """Aggregates of the samples in one slice of a window"""
+
+    __slots__ = ('index', 'count', 'mean', 'm2', 'low', 'high', 'buckets')
+
+    def __init__(self, index):
+        self.index = index
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.low = math.inf
+        self.high = -math.inf
+        self.buckets = {}
+
+
+class WindowStats:
+    """Statistics of the samples of the last `seconds`, kept as a queue of panes
+
+    Adding a sample updates the running Welford mean/variance, the newest pane and the sketch;
+    an expiring pane is subtracted again (Chan's parallel formula in reverse). The minimum and
+    maximum are the heads of monotonic deques of panes."""
+
+    def __init__(self, seconds, panes=PANES):
+        self.seconds = seconds
+        self.width = seconds / panes
+        self.pane_count = panes
+        self.panes = deque()
+        self.lows = deque()
+        self.highs = deque()
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.buckets = {}
+
+    def add(self, now, value):
+        index = int(now // self.width)
+        self.expire(index)
+        # A clock that steps back files the sample under the newest pane
+        pane = self.panes[-1] if self.panes and self.panes[-1].index >= index else None
+        if pane is None:
+            pane = Pane(index)
+            self.panes.append(pane)
+
+        pane.count += 1
+        delta = value - pane.mean
+        pane.mean += delta / pane.count
+        pane.m2 += delta * (value - pane.mean)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        key = bucket_key(value)
+        pane.buckets[key] = pane.buckets.get(key, 0) + 1
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+        # The newest pane is always the tail of both deques, so only the tails need fixing
+        if value < pane.low:
+            pane.low = value
+            while self.lows and self.lows[-1].low >= value:
+                self.lows.pop()
+            self.lows.append(pane)
+        if value > pane.high:
+            pane.high = value
+            while self.highs and self.highs[-1].high <= value:
+                self.highs.pop()
+            self.highs.append(pane)
+
+    def expire(self, index):
+        """Drop the panes that slid out of the window ending in pane index"""
+        oldest = index - self.pane_count
+        while self.panes and self.panes[0].index <= oldest:
+            pane = self.panes.popleft()
+            rest = self.count - pane.count
+            if rest <= 0:
+                self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            else:
+                rest_mean = (self.count * self.mean - pane.count * pane.mean) / rest
+                delta = pane.mean - rest_mean
+                self.m2 = max(self.m2 - pane.m2 - delta * delta * rest * pane.count / self.count, 0.0)
+                self.count, self.mean = rest, rest_mean
+            for key, count in pane.buckets.items():
+                remaining = self.buckets[key] - count
+                if remaining:
+                    self.buckets[key] = remaining
+                else:
+                    del self.buckets[key]
+            if self.lows and self.lows[0] is pane:
+                self.lows.popleft()
+            if self.highs and self.highs[0] is pane:
+                self.highs.popleft()
+
+    def quantiles(self, quantiles=QUANTILES):
+        """Estimate the given quantiles from the sketch, clamped to the exact extremes
+
+        Nearest rank rounded up (the ceil(q * count)-th smallest sample), so high percentiles of a small
+        window reach into its tail: of 5 samples, p99 is the largest."""
+        low, high = self.lows[0].low, self.highs[0].high
+        ordered = sorted(self.buckets.items())
+        results = []
+        position, seen = 0, ordered[0][1]
+        for q in quantiles:
+            rank = max(1, math.ceil(q * self.count))
+            while seen < rank and position < len(ordered) - 1:
+                position += 1
+                seen += ordered[position][1]
+            results.append(min(max(bucket_value(ordered[position][0]), low), high))
+        return results
+
+    def summary(self, now):
+        self.expire(int(now // self.width))
+        if not self.count:
+            return {'count': 0}
+        summary = {
+            'count': self.count,
+            'mean': self.mean,
+            'stddev': math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0,
+            'min': self.lows[0].low,
+            'max': self.highs[0].high
+        }
+        for q, value in zip(QUANTILES, self.quantiles()):
+            summary[f"p{round(q * 100)}"] = value
+        return summary
+
+
+class StatsEngine:
+    """Window statistics of every thing and of all things together"""
+
+    def __init__(self, windows):
+        self.windows = windows
+        self.things = {}
+        self.fleet = self.trackers()
+        # Bumped per sample, so cached responses know when to rebuild
+        self.samples = 0
+        self.lock = threading.Lock()
+
+    def trackers(self):
+        return {name: WindowStats(seconds) for name, seconds in self.windows.items()}
+
+    def add(self, thing_id, value, now=None):
+        """Feed one sample, timestamped with its arrival unless now is given"""
+        now = time.time() if now is None else now
+        with self.lock:
+            trackers = self.things.get(thing_id)
+            if trackers is None:
+                trackers = self.things[thing_id] = self.trackers()
+            for tracker in trackers.values():
+                tracker.add(now, value)
+            for tracker in self.fleet.values():
+                tracker.add(now, value)
+            self.samples += 1
+
+    def forget(self, thing_id):
+        with self.lock:
+            self.things.pop(thing_id, None)
+
+    def summarize(self, trackers, windows=None, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            return {name: trackers[name].summary(now) for name in windows or self.windows}
+
+    def thing(self, thing_id, windows=None, now=None):
+        """Return a thing's statistics per window, or None if it has no samples"""
+        trackers = self.things.get(thing_id)
+        return None if trackers is None else self.summarize(trackers, windows, now)
+
+    def fleet_summary(self, windows=None, now=None):
+        """Return the statistics of all samples of all things per window"""
+        return self.summarize(self.fleet, windows, now)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Compact per-thing state for the Digital Twin Dashboard
+Latest temp properties (and policy and attributes) of every tracked thing, stored column by column
+"""
+
+import sys
+import threading
+from array import array
+
+DEFAULTS = {'value': 0.0, 'unit': 'celsius', 'timestamp': '', 'status': 'unknown'}
+
+
+class ThingTable:
+    """Rows indexed by thing ID; values in a float array, strings interned in lists
+
+    Every change stamps the row with the next value of a table-wide sequence, so a thing that is
+    dropped and tracked again never reuses a version."""
+
+    def __init__(self):
+        self.index = {}
+        self.thing_ids = []
+        self.values = array('d')
+        self.units = []
+        self.timestamps = []
+        self.statuses = []
+        self.policy_ids = []
+        self.attributes = []
+        self.versions = array('Q')
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.thing_ids)
+
+    def __contains__(self, thing_id):
+        return thing_id in self.index
+
+    def update(self, thing_id, properties, replace=False):
+        """Merge temp properties into a thing's row; returns the changed properties (empty if none)
+
+        Keys missing from properties keep their value unless replace is set, None resets a key
+        (merge-patch semantics, as in Ditto change events)."""
+        with self.lock:
+            row = self.index.get(thing_id)
+            created = row is None
+            if created:
+                row = len(self.thing_ids)
+                self.thing_ids.append(thing_id)
+                self.values.append(DEFAULTS['value'])
+                self.units.append(DEFAULTS['unit'])
+                self.timestamps.append(DEFAULTS['timestamp'])
+                self.statuses.append(DEFAULTS['status'])
+                self.policy_ids.append('')
+                self.attributes.append({})
+                self.versions.append(0)
+                self.index[thing_id] = row
+
+            changed = {}
+            for key, column in (('unit', self.units), ('timestamp', self.timestamps), ('status', self.statuses)):
+                if key in properties or replace:
+                    new = properties.get(key)
+                    new = DEFAULTS[key] if new is None else sys.intern(str(new))
+                    if column[row] != new:
+                        column[row] = changed[key] = new
+            if 'value' in properties or replace:
+                try:
+                    new = float(properties.get('value'))
+                except (TypeError, ValueError):
+                    new = DEFAULTS['value']
+                if self.values[row] != new:
+                    self.values[row] = changed['value'] = new
+            if created:
+                changed = self.properties(row)
+            if changed:
+                self.sequence += 1
+                self.versions[row] = self.sequence
+            return changed
+
+    def update_meta(self, thing_id, meta, replace=False):
+        """Merge a tracked thing's policyId and attributes; returns True if they changed
+
+        Attribute keys are merged one level deep like update() merges properties, replace sets both anew."""
+        with self.lock:
+            row = self.index.get(thing_id)
+            if row is None:
+                return False
+            policy_id = self.policy_ids[row]
+            if 'policyId' in meta or replace:
+                policy_id = sys.intern(str(meta.get('policyId') or ''))
+            attributes = self.attributes[row]
+            if 'attributes' in meta or replace:
+                patch = meta.get('attributes') or {}
+                attributes = {} if replace or not isinstance(patch, dict) else dict(attributes)
+                for key, value in (patch.items() if isinstance(patch, dict) else ()):
+                    if value is None:
+                        attributes.pop(key, None)
+                    else:
+                        attributes[key] = value
+            if policy_id == self.policy_ids[row] and attributes == self.attributes[row]:
+                return False
+            self.policy_ids[row] = policy_id
+            self.attributes[row] = attributes
+            self.sequence += 1
+            self.versions[row] = self.sequence
+            return True
+
+    def meta(self, thing_id):
+        """Return a thing's policyId and attributes, or None if it is not tracked"""
+        with self.lock:
+            row = self.index.get(thing_id)
+            return None if row is None else {'policyId': self.policy_ids[row], 'attributes': self.attributes[row]}
+
+    def remove(self, thing_id):
+        """Drop a thing's row by moving the last row into its slot"""
+        with self.lock:
+            row = self.index.pop(thing_id, None)
+            if row is None:
+                return
+            self.sequence += 1
+            last = len(self.thing_ids) - 1
+            if row != last:
+                moved = self.thing_ids[last]
+                self.index[moved] = row
+                for column in self.columns():
+                    column[row] = column[last]
+            for column in self.columns():
+                column.pop()
+
+    def columns(self):
+        return (self.thing_ids, self.values, self.units, self.timestamps, self.statuses,
+                self.policy_ids, self.attributes, self.versions)
+
+    def properties(self, row):
+        return {
+            'value': self.values[row],
+            'unit': self.units[row],
+            'timestamp': self.timestamps[row],
+            'status': self.statuses[row]
+        }
+
+    def snapshot(self, thing_id):
+        """Return a thing's (version, temp properties) read together, or None"""
+        with self.lock:
+            row = self.index.get(thing_id)
+            return None if row is None else (self.versions[row], self.properties(row))
+
+    def get(self, thing_id):
+        """Return a thing's temp properties, or None if it is not tracked"""
+        with self.lock:
+            row = self.index.get(thing_id)
+            return None if row is None else self.properties(row)
+
+    def rows(self, offset=0, limit=None):
+        """Return a slice of all rows, sorted by thing ID"""
+        with self.lock:
+            ordered = sorted(self.index.items())
+            end = None if limit is None else offset + limit
+            return [dict(self.properties(row), thingId=thing_id) for thing_id, row in ordered[offset:end]]
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Micro-batching stage between reading generation and the transport
+Coalesces readings per thing within a window and flushes them as merge patches
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    def __init__(self, flush_callback, window_seconds=1.0, max_readings=1000):
+        """Initialize the batcher; flush_callback(thing_id, properties) writes one thing."""
+        self.flush_callback = flush_callback
+        self.window_seconds = window_seconds
+        self.max_readings = max_readings
+
+        # thing_id -> latest properties within the current window
+        self.window = {}
+        self.window_readings = 0
+        self.full = asyncio.Event()
+        self.stats = {
+            'submitted': 0,
+            'coalesced': 0,
+            'flushes': 0
+        }
+
+    def submit(self, thing_id, properties):
+        """Add a reading to the current window, superseding older ones of the same thing."""
+        current = self.window.get(thing_id)
+        if current is None:
+            self.window[thing_id] = dict(properties)
+        else:
+            current.update(properties)
+            self.stats['coalesced'] += 1
+        self.stats['submitted'] += 1
+        self.window_readings += 1
+        if self.window_readings >= self.max_readings:
+            self.full.set()
+
+    async def flush(self):
+        """Write out the current window, one merge per thing, concurrently."""
+        self.full.clear()
+        if not self.window:
+            return
+        window, self.window, self.window_readings = self.window, {}, 0
+        self.stats['flushes'] += 1
+        await asyncio.gather(*(self.flush_callback(thing_id, properties)
+                               for thing_id, properties in window.items()))
+
+    async def run(self):
+        """Flush whenever the window time elapses or the reading count is reached."""
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self.full.wait(), self.window_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                await self.flush()
+        finally:
+            # Do not drop the last partial window on shutdown
+            await self.flush()
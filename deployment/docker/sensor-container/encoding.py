@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Request body encodings for the Temperature Sensor Service
+Compact JSON by default, CBOR (RFC 8949) on request, with a fallback to JSON if Ditto does not take it
+"""
+
+import json
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+JSON = 'application/json'
+CBOR = 'application/cbor'
+UNSUPPORTED_MEDIA_TYPE = 415
+
+
+class BodyEncoder:
+    def __init__(self, encoding='json'):
+        """Initialize the encoder; 'cbor' needs the cbor2 package."""
+        if encoding not in ('json', 'cbor'):
+            raise ValueError(f"body_encoding must be 'json' or 'cbor', not {encoding!r}")
+        self.cbor = None
+        if encoding == 'cbor':
+            # Imported lazily so JSON bodies do not need cbor2
+            import cbor2
+            self.cbor = cbor2
+            logger.info("📦 Sending CBOR request bodies")
+
+    def encode(self, value):
+        """Return the body bytes and content type of a value."""
+        if self.cbor is not None:
+            body, content_type = self.cbor.dumps(value), CBOR
+        else:
+            body, content_type = json.dumps(value, separators=(',', ':')).encode('utf-8'), JSON
+        metrics.BODY_BYTES.inc(content_type, amount=len(body))
+        return body, content_type
+
+    def rejected(self, status):
+        """Return True if status says Ditto does not take CBOR; every later body is JSON, so resend as JSON."""
+        if self.cbor is None or status != UNSUPPORTED_MEDIA_TYPE:
+            return False
+        logger.warning("⚠️ Ditto does not accept CBOR bodies (415), sending JSON from now on")
+        self.cbor = None
+        return True
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Fleet mode for the Temperature Sensor Service
+Simulates many Digital Twins from a single asyncio event loop
+"""
+
+import math
+import asyncio
+import random
+import logging
+from datetime import datetime
+
+from transports import create_transport
+from statuses import WRITTEN, is_transient
+from journal import ReplayPacer
+from publish import PROPERTIES_PATH, VALUE_PATH
+from provisioning import Provisioner, thing_json
+import metrics
+import tracing
+from batching import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+
+class FleetSimulator:
+    def __init__(self, config, thing_ids=None, journal=None, publish_policy=None):
+        """Initialize the fleet from the sensor configuration."""
+        self.config = config
+        fleet = config.get('fleet', {})
+        self.base_url = config['ditto_api_url']
+        self.update_interval = config['update_interval']
+        self.temp_range = config['temp_range']
+
+        if thing_ids is None:
+            pattern = fleet.get('thing_id_pattern', 'demo:sensor-{index}')
+            start_index = fleet.get('start_index', 1)
+            count = fleet.get('count', 100)
+            thing_ids = [pattern.format(index=i) for i in range(start_index, start_index + count)]
+        self.thing_ids = thing_ids
+
+        self.max_concurrency = fleet.get('max_concurrency', 500)
+        self.stats_interval = fleet.get('stats_interval', 10)
+
+        # Commands queued during an outage may only time out if the journal takes them back
+        self.transport = create_transport(config, expire_queued=journal is not None)
+
+        batching = config.get('batching', {})
+        self.batcher = None
+        if batching.get('enabled'):
+            self.batcher = MicroBatcher(
+                lambda thing_id, data: self.write_properties(thing_id, data, merge=True),
+                # A shorter window never sees two readings of the same thing, so it could not coalesce any
+                window_seconds=batching.get('window_seconds') or self.update_interval,
+                max_readings=batching.get('max_readings', 1000)
+            )
+
+        # Readings of all things are generated in one vectorized call per interval
+        signal = config.get('signal', {})
+        self.signal_engine = None
+        self.readings = None
+        if signal.get('engine') == 'realistic':
+            from signals import SignalEngine
+            self.signal_engine = SignalEngine(len(self.thing_ids), self.temp_range, signal, self.update_interval)
+
+        # Store-and-forward journal shared with the sensor service, if enabled
+        self.journal = journal
+        if journal:
+            self.replay_pacer = ReplayPacer(config.get('store_and_forward', {}).get('replay_rate', 50))
+
+        # Report-by-exception policy shared with the sensor service, if enabled
+        self.publish_policy = publish_policy
+
+        # Things are created up front; set once the shared policy is known to exist
+        self.provisioning = config.get('provisioning', {}).get('enabled', True)
+        self.policy_id = None
+
+        metrics.QUEUE_DEPTH.set_function(self.queue_depth)
+
+        self.running = True
+        self.semaphore = None
+        self.stats = {
+            'sent': 0,
+            'failed': 0,
+            'created': 0,
+            'skipped_ticks': 0,
+            'dropouts': 0,
+            'suppressed': 0
+        }
+
+        if self.thing_ids:
+            logger.info(f"🚚 Fleet mode: {len(self.thing_ids)} things ({self.thing_ids[0]} .. {self.thing_ids[-1]})")
+        logger.info(f"🔗 API: {self.base_url}")
+        if self.thing_ids:
+            logger.info(f"⏱️  Interval: {self.update_interval}s per thing")
+        logger.info(f"🚦 Concurrency: {self.max_concurrency} in flight via {type(self.transport).__name__}")
+        if self.batcher:
+            logger.info(f"📦 Batching: {self.batcher.window_seconds}s / {self.batcher.max_readings} readings per window")
+        if self.publish_policy:
+            logger.info(f"🔇 Report by exception: {self.publish_policy.describe()}")
+
+    def queue_depth(self):
+        """Return the readings held in memory between generation and Ditto."""
+        window = len(self.batcher.window) if self.batcher else 0
+        return window + self.transport.queue_depth()
+
+    def generate_temperature(self, index):
+        """Return the current reading of a thing, or None if the sensor dropped out."""
+        if self.signal_engine is None:
+            return round(random.uniform(self.temp_range['min'], self.temp_range['max']), 1)
+        value = self.readings[index]
+        return None if math.isnan(value) else value
+
+    async def advance_signals(self):
+        """Generate the next batch of readings for all things once per interval."""
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while self.running:
+            next_tick += self.update_interval
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+            self.readings = self.signal_engine.next_batch().tolist()
+
+    async def create_thing(self, thing_id):
+        """Create a missing thing under the shared policy, or an implicit one if there is none."""
+        with tracing.span('ditto.create_thing', tracing.CLIENT, thing=thing_id) as span:
+            status = await self.transport.create_thing(thing_id, thing_json(self.policy_id))
+            span.set('status', status)
+        if status in WRITTEN:
+            self.stats['created'] += 1
+            metrics.THINGS_CREATED.inc()
+            return True
+        logger.warning(f"⚠️ Could not auto-create {thing_id}: {status}")
+        return False
+
+    async def send_temperature_reading(self, thing_id, temperature):
+        """Send one temperature reading of a thing to Ditto."""
+        data = {
+            "value": temperature,
+            "unit": "celsius",
+            "timestamp": datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "status": "active"
+        }
+        metrics.READINGS_GENERATED.inc()
+        reason = None
+        if self.publish_policy:
+            reason = self.publish_policy.decide(thing_id, temperature)
+            if reason is None:
+                self.stats['suppressed'] += 1
+                return False
+        if self.journal and self.journal.depth(thing_id):
+            # Never let a fresh reading overtake older ones still waiting in the journal
+            self.journal.append(thing_id, PROPERTIES_PATH, data)
+            return False
+        if self.batcher:
+            # Batches are merge patches, which leave the properties they do not name alone anyway
+            self.batcher.submit(thing_id, data)
+            return True
+        value_only = reason is not None and self.publish_policy.value_only_write(reason)
+        return await self.write_properties(thing_id, data, value_only=value_only)
+
+    async def deliver(self, thing_id, path, data, merge=False):
+        """Write a value to a thing, creating the thing if it is missing, and return the status."""
+        write = self.transport.merge if merge else self.transport.modify
+        loop = asyncio.get_running_loop()
+
+        async with self.semaphore:
+            started = loop.time()
+            with tracing.span('ditto.write', tracing.CLIENT, thing=thing_id, merge=merge) as span:
+                status = await write(thing_id, path, data)
+                span.set('status', status)
+            metrics.record_write(status, loop.time() - started)
+            if status == 404 and await self.create_thing(thing_id):
+                metrics.WRITE_RETRIES.inc()
+                started = loop.time()
+                with tracing.span('ditto.write', tracing.CLIENT, thing=thing_id, merge=merge, retry=True) as span:
+                    status = await write(thing_id, path, data)
+                    span.set('status', status)
+                metrics.record_write(status, loop.time() - started)
+        if status in WRITTEN:
+            metrics.READINGS_SENT.inc()
+        return status
+
+    async def write_properties(self, thing_id, data, merge=False, value_only=False):
+        """Write the temp properties of a thing, or only their value, buffering them if Ditto is unreachable."""
+        if value_only:
+            status = await self.deliver(thing_id, VALUE_PATH, data['value'])
+        else:
+            status = await self.deliver(thing_id, PROPERTIES_PATH, data, merge)
+
+        if status in WRITTEN:
+            self.stats['sent'] += 1
+            return True
+        logger.debug(f"Failed to send temperature for {thing_id}: {status}")
+        self.stats['failed'] += 1
+        if self.journal and is_transient(status):
+            # Buffered in full, so the replayed reading also carries its timestamp
+            self.journal.append(thing_id, PROPERTIES_PATH, data)
+        elif self.publish_policy:
+            # Next reading is written in full, whatever the deadband says
+            self.publish_policy.forget(thing_id)
+        return False
+
+    async def replay_journal(self):
+        """Drain buffered readings in their original order, paced by replay_rate."""
+        while self.running:
+            entries = self.journal.oldest(limit=100)
+            if not entries:
+                await asyncio.sleep(1)
+                continue
+            for entry_id, thing_id, path, data in entries:
+                await asyncio.sleep(self.replay_pacer.delay())
+                status = await self.deliver(thing_id, path, data)
+                if is_transient(status):
+                    # Ditto still unreachable, probe again shortly
+                    await asyncio.sleep(1)
+                    break
+                # Readings Ditto rejects outright would block the journal forever
+                self.journal.remove(entry_id, replayed=status in WRITTEN)
+
+    async def run_thing(self, index, thing_id, phase):
+        """Tick one thing on a drift-free schedule offset by its start phase."""
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + phase
+
+        while self.running:
+            delay = next_tick - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            with tracing.span('sensor.reading', thing=thing_id):
+                temperature = self.generate_temperature(index)
+                if temperature is None:
+                    self.stats['dropouts'] += 1
+                else:
+                    await self.send_temperature_reading(thing_id, temperature)
+
+            # Schedule against absolute tick times so latency does not accumulate;
+            # ticks missed while a slow request was in flight are skipped, not bursted.
+            next_tick += self.update_interval
+            behind = loop.time() - next_tick
+            if behind > 0:
+                missed = int(behind // self.update_interval) + 1
+                next_tick += missed * self.update_interval
+                self.stats['skipped_ticks'] += missed
+
+    async def report_stats(self):
+        """Periodically log aggregated fleet throughput."""
+        last_sent = 0
+        last_replayed = 0
+        while self.running:
+            await asyncio.sleep(self.stats_interval)
+            sent = self.stats['sent']
+            rate = (sent - last_sent) / self.stats_interval
+            last_sent = sent
+            logger.info(f"📊 {rate:.0f} updates/s | sent={sent} failed={self.stats['failed']} "
+                        f"created={self.stats['created']} skipped_ticks={self.stats['skipped_ticks']} "
+                        f"dropouts={self.stats['dropouts']} suppressed={self.stats['suppressed']}")
+            if self.journal:
+                replayed = self.journal.stats['replayed']
+                drain_rate = (replayed - last_replayed) / self.stats_interval
+                last_replayed = replayed
+                logger.info(f"📼 backlog={self.journal.depth()} drain={drain_rate:.0f}/s "
+                            f"replayed={replayed} evicted={self.journal.stats['evicted']}")
+            if self.batcher:
+                logger.info(f"📦 submitted={self.batcher.stats['submitted']} "
+                            f"coalesced={self.batcher.stats['coalesced']} flushes={self.batcher.stats['flushes']}")
+
+    async def run(self):
+        """Run all simulated things until cancelled."""
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.provisioning:
+            provisioner = Provisioner(self.config)
+            await provisioner.provision(self.thing_ids)
+            self.policy_id = provisioner.policy_id
+        await self.transport.start()
+
+        # Spread start phases evenly over one interval to avoid synchronized bursts
+        step = self.update_interval / max(len(self.thing_ids), 1)
+        tasks = []
+        if self.signal_engine:
+            self.readings = self.signal_engine.next_batch().tolist()
+            tasks.append(asyncio.create_task(self.advance_signals()))
+        tasks += [asyncio.create_task(self.run_thing(index, thing_id, index * step))
+                  for index, thing_id in enumerate(self.thing_ids)]
+        tasks.append(asyncio.create_task(self.report_stats()))
+        if self.batcher:
+            tasks.append(asyncio.create_task(self.batcher.run()))
+        if self.journal:
+            tasks.append(asyncio.create_task(self.replay_journal()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            self.running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.transport.close()
+
+    def run_simulation(self):
+        """Run the fleet simulation on a fresh event loop."""
+        logger.info("🚀 Starting fleet simulation...")
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            logger.info("🛑 Fleet simulation stopped by user")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Store-and-forward journal for sensor readings
+Persists unsent readings in SQLite (WAL mode) and hands them back oldest first
+"""
+
+import json
+import time
+import sqlite3
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Approximate per-row overhead of the SQLite record and index entry
+ROW_OVERHEAD = 32
+
+
+class ReadingJournal:
+    def __init__(self, path, max_bytes=50 * 1024 * 1024):
+        """Open (or create) the journal at path, bounded to roughly max_bytes of readings."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS readings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                thing_id TEXT NOT NULL,
+                path TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.db.commit()
+
+        # Backlog per thing is kept in memory so the write path never queries SQLite
+        self.backlog = Counter()
+        self.entries = 0
+        self.bytes = 0
+        for thing_id, count, size in self.db.execute(
+                "SELECT thing_id, COUNT(*), SUM(LENGTH(payload) + LENGTH(thing_id) + LENGTH(path)) "
+                "FROM readings GROUP BY thing_id"):
+            self.backlog[thing_id] = count
+            self.entries += count
+            self.bytes += size + count * ROW_OVERHEAD
+
+        self.stats = {
+            'appended': 0,
+            'replayed': 0,
+            'evicted': 0,
+            'dropped': 0
+        }
+        if self.depth():
+            logger.info(f"📼 Journal {path} holds {self.depth()} unsent readings")
+
+    @staticmethod
+    def row_size(thing_id, path, payload):
+        """Estimate the bytes a journal row occupies."""
+        return len(thing_id) + len(path) + len(payload) + ROW_OVERHEAD
+
+    def depth(self, thing_id=None):
+        """Return the number of buffered readings, overall or for one thing."""
+        if thing_id is None:
+            return self.entries
+        return self.backlog.get(thing_id, 0)
+
+    def append(self, thing_id, path, value):
+        """Persist a reading that could not be delivered."""
+        payload = json.dumps(value)
+        self.db.execute(
+            "INSERT INTO readings (thing_id, path, payload, created_at) VALUES (?, ?, ?, ?)",
+            (thing_id, path, payload, time.time())
+        )
+        self.db.commit()
+        self.backlog[thing_id] += 1
+        self.entries += 1
+        self.bytes += self.row_size(thing_id, path, payload)
+        self.stats['appended'] += 1
+        if self.bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Drop the oldest readings until the journal fits into max_bytes again."""
+        while self.bytes > self.max_bytes:
+            rows = self.db.execute(
+                "SELECT id, thing_id, path, payload FROM readings ORDER BY id LIMIT 100").fetchall()
+            if not rows:
+                self.entries = 0
+                self.bytes = 0
+                break
+            for entry_id, thing_id, path, payload in rows:
+                self.forget(thing_id, self.row_size(thing_id, path, payload))
+                self.stats['evicted'] += 1
+                if self.bytes <= self.max_bytes:
+                    last_id = entry_id
+                    break
+            else:
+                last_id = rows[-1][0]
+            self.db.execute("DELETE FROM readings WHERE id <= ?", (last_id,))
+        self.db.commit()
+        logger.debug(f"📼 Journal full, evicted oldest readings ({self.stats['evicted']} so far)")
+
+    def forget(self, thing_id, size):
+        """Update the in-memory accounting for a removed row."""
+        self.backlog[thing_id] -= 1
+        if self.backlog[thing_id] <= 0:
+            del self.backlog[thing_id]
+        self.entries -= 1
+        self.bytes -= size
+
+    def oldest(self, limit=100):
+        """Return up to limit buffered readings in original order as (id, thing_id, path, value)."""
+        rows = self.db.execute(
+            "SELECT id, thing_id, path, payload FROM readings ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [(entry_id, thing_id, path, json.loads(payload)) for entry_id, thing_id, path, payload in rows]
+
+    def remove(self, entry_id, replayed=True):
+        """Remove a reading once it was delivered (or given up on)."""
+        row = self.db.execute(
+            "SELECT thing_id, path, payload FROM readings WHERE id = ?", (entry_id,)).fetchone()
+        if row is None:
+            return  # already evicted
+        self.db.execute("DELETE FROM readings WHERE id = ?", (entry_id,))
+        self.db.commit()
+        self.forget(row[0], self.row_size(*row))
+        self.stats['replayed' if replayed else 'dropped'] += 1
+
+    def close(self):
+        """Close the database."""
+        self.db.close()
+
+
+class ReplayPacer:
+    def __init__(self, rate):
+        """Pace replayed readings to at most rate per second (0 or less replays unpaced)."""
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = 0.0
+
+    def delay(self):
+        """Reserve the next slot and return how long to wait for it."""
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        return slot - now
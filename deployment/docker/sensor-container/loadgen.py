@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Open-loop benchmark mode for the Temperature Sensor Service
+Fires writes on a fixed schedule regardless of responses and reports latency percentiles
+"""
+
+import json
+import math
+import random
+import asyncio
+import logging
+from datetime import datetime
+
+from transports import create_transport
+from statuses import TIMED_OUT
+from provisioning import Provisioner
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = [50, 90, 99, 99.9]
+
+
+class LatencyHistogram:
+    """HDR-style log-linear histogram of microsecond latencies (~1.6% relative precision)."""
+
+    SUB_BUCKET_BITS = 7
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    HALF_SUB_BUCKETS = SUB_BUCKETS >> 1
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def bucket_index(self, value):
+        """Map a value to its bucket; values below SUB_BUCKETS are exact."""
+        if value < self.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - self.SUB_BUCKET_BITS
+        return self.SUB_BUCKETS + (shift - 1) * self.HALF_SUB_BUCKETS + (value >> shift) - self.HALF_SUB_BUCKETS
+
+    def bucket_value(self, index):
+        """Return the highest value that falls into a bucket."""
+        if index < self.SUB_BUCKETS:
+            return index
+        shift = (index - self.SUB_BUCKETS) // self.HALF_SUB_BUCKETS + 1
+        mantissa = (index - self.SUB_BUCKETS) % self.HALF_SUB_BUCKETS + self.HALF_SUB_BUCKETS
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, micros):
+        """Record one latency in microseconds."""
+        micros = max(0, int(micros))
+        index = self.bucket_index(micros)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.sum += micros
+        self.max = max(self.max, micros)
+        self.min = micros if self.min is None else min(self.min, micros)
+
+    def merge(self, other):
+        """Add the recordings of another histogram to this one."""
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def percentile(self, percent):
+        """Return the value at a percentile (0-100) in microseconds."""
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(percent / 100 * self.total))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.bucket_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        """Summarize the histogram in milliseconds."""
+        summary = {'count': self.total}
+        if self.total:
+            for percent in PERCENTILES:
+                summary[f"p{percent:g}"] = self.percentile(percent) / 1000
+            summary['min'] = self.min / 1000
+            summary['max'] = self.max / 1000
+            summary['mean'] = round(self.sum / self.total / 1000, 3)
+        return summary
+
+
+class OpenLoopLoadGenerator:
+    def __init__(self, config):
+        """Initialize the load generator from the sensor configuration."""
+        self.config = config
+        fleet = config.get('fleet', {})
+        bench = config.get('benchmark', {})
+        self.temp_range = config['temp_range']
+        self.target_rate = bench.get('target_rate', 1000)
+        self.duration = bench.get('duration', 60)
+        self.warmup = bench.get('warmup', 5)
+        self.max_outstanding = bench.get('max_outstanding', 10000)
+        self.report_path = bench.get('report_path', 'benchmark_report.json')
+
+        pattern = fleet.get('thing_id_pattern', 'demo:sensor-{index}')
+        start_index = fleet.get('start_index', 1)
+        count = fleet.get('count', 100)
+        self.thing_ids = [pattern.format(index=i) for i in range(start_index, start_index + count)]
+
+        # A write stuck behind an outage counts as a timeout, so the run always finishes
+        self.transport = create_transport(config, expire_queued=True)
+        self.histograms = {}
+        self.outstanding = 0
+        self.shed = 0
+
+        logger.info(f"🏁 Benchmark: {self.target_rate} writes/s open loop for {self.duration}s "
+                    f"(+{self.warmup}s warmup) across {len(self.thing_ids)} things")
+
+    async def fire(self, thing_id, intended_start, measuring):
+        """Send one write and record its latency from the intended (not actual) start."""
+        loop = asyncio.get_running_loop()
+        data = {
+            "value": round(random.uniform(self.temp_range['min'], self.temp_range['max']), 1),
+            "unit": "celsius",
+            "timestamp": datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "status": "active"
+        }
+        try:
+            status = await self.transport.modify(thing_id, "/features/temp/properties", data)
+        finally:
+            self.outstanding -= 1
+        if not measuring:
+            return
+
+        if status is None:
+            key = 'error'
+        elif status == TIMED_OUT:
+            key = 'timeout'
+        else:
+            key = str(status)
+        histogram = self.histograms.setdefault(key, LatencyHistogram())
+        histogram.record((loop.time() - intended_start) * 1_000_000)
+
+    async def run(self):
+        """Issue writes on a fixed schedule and return the report."""
+        loop = asyncio.get_running_loop()
+        if self.config.get('provisioning', {}).get('enabled', True):
+            # Every write should hit an existing thing, not measure 404s
+            await Provisioner(self.config).provision(self.thing_ids)
+        await self.transport.start()
+        interval = 1.0 / self.target_rate
+        tasks = set()
+        try:
+            start = loop.time()
+            measure_start = start + self.warmup
+            end = measure_start + self.duration
+            sent = 0
+            while True:
+                # Send slots are fixed in advance; a slow response never delays the next slot
+                intended = start + sent * interval
+                if intended >= end:
+                    break
+                delay = intended - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                measuring = intended >= measure_start
+                if self.outstanding >= self.max_outstanding:
+                    if measuring:
+                        self.shed += 1
+                else:
+                    self.outstanding += 1
+                    thing_id = self.thing_ids[sent % len(self.thing_ids)]
+                    task = asyncio.create_task(self.fire(thing_id, intended, measuring))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                sent += 1
+            actual_duration = loop.time() - measure_start
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            await self.transport.close()
+        return self.report(actual_duration)
+
+    def report(self, actual_duration):
+        """Build the machine-readable benchmark report."""
+        overall = LatencyHistogram()
+        for histogram in self.histograms.values():
+            overall.merge(histogram)
+        completed = overall.total
+        ok = sum(h.total for key, h in self.histograms.items() if key.startswith('2'))
+        timeouts = self.histograms['timeout'].total if 'timeout' in self.histograms else 0
+        attempted = completed + self.shed
+        return {
+            'timestamp': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'transport': self.config.get('transport', 'http'),
+            'things': len(self.thing_ids),
+            'target_rate': self.target_rate,
+            'duration': round(actual_duration, 3),
+            'requests': completed,
+            'achieved_rate': round(completed / actual_duration, 1) if actual_duration > 0 else 0,
+            'error_rate': round((attempted - ok) / attempted, 5) if attempted else 0,
+            'timeouts': timeouts,
+            'shed': self.shed,
+            'latency_ms': overall.summary(),
+            'latency_ms_by_status': {key: h.summary() for key, h in sorted(self.histograms.items())}
+        }
+
+    def run_benchmark(self):
+        """Run the benchmark, then log and write the report."""
+        logger.info("🚀 Starting open-loop benchmark...")
+        report = asyncio.run(self.run())
+        with open(self.report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        latency = report['latency_ms']
+        logger.info(f"🏁 {report['achieved_rate']}/s achieved of {report['target_rate']}/s target, "
+                    f"error rate {report['error_rate']:.2%}, {report['timeouts']} timeouts")
+        if latency['count']:
+            logger.info(f"⏱️  p50={latency['p50']}ms p90={latency['p90']}ms "
+                        f"p99={latency['p99']}ms p99.9={latency['p99.9']}ms")
+        logger.info(f"📄 Report written to {self.report_path}")
+        return report
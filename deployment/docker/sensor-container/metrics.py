@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Lightweight Prometheus-style metrics for the Temperature Sensor Service
+Counters, gauges and histograms rendered in the text exposition format over HTTP
+"""
+
+import hmac
+import bisect
+import logging
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tracing import PROFILER
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+def format_labels(label_names, label_values):
+    """Render a label set like {status="204"}."""
+    pairs = list(zip(label_names, label_values))
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        """Increase the counter of a label set."""
+        key = tuple(str(value) for value in label_values)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, *label_values):
+        """Return the current value of a label set."""
+        return self.values.get(tuple(str(value) for value in label_values), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        # copy() is atomic, the simulation may add label sets while we scrape
+        for key, value in sorted(self.values.copy().items()):
+            lines.append(f"{self.name}{format_labels(self.label_names, key)} {value}")
+        if not self.values and not self.label_names:
+            lines.append(f"{self.name} 0")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Read the value from function at scrape time."""
+        self.function = function
+
+    def render(self):
+        value = self.function() if self.function else self.value
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets + [float('inf')], self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else f"{bound:g}"
+            lines.append(f'{self.name}_bucket{{le="{le}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+READINGS_GENERATED = Counter('sensor_readings_generated_total', 'Readings produced by the simulator')
+READINGS_SENT = Counter('sensor_readings_sent_total', 'Readings accepted by Ditto')
+WRITE_RESPONSES = Counter('sensor_write_responses_total', 'Write responses by status (error = no connection)',
+                          ('status',))
+WRITE_LATENCY = Histogram('sensor_write_latency_seconds', 'Latency of writes to Ditto')
+WRITE_RETRIES = Counter('sensor_write_retries_total', 'Writes repeated after recreating a missing thing')
+THINGS_CREATED = Counter('sensor_things_created_total', 'Things auto-created by the simulator')
+BACKLOG_DEPTH = Gauge('sensor_backlog_depth', 'Readings buffered in the store-and-forward journal')
+QUEUE_DEPTH = Gauge('sensor_queue_depth', 'Readings waiting in memory for the transport')
+READINGS_PUBLISHED = Counter('sensor_readings_published_total',
+                             'Readings the publish policy let through (initial, change or heartbeat)', ('reason',))
+READINGS_SUPPRESSED = Counter('sensor_readings_suppressed_total',
+                              'Readings the publish policy held back (deadband or min_interval)', ('reason',))
+
+BODY_BYTES = Counter('sensor_request_body_bytes_total', 'Bytes of request bodies by content type',
+                     ('content_type',))
+
+REGISTRY = [READINGS_GENERATED, READINGS_SENT, WRITE_RESPONSES, WRITE_LATENCY,
+            WRITE_RETRIES, THINGS_CREATED, BACKLOG_DEPTH, QUEUE_DEPTH, READINGS_PUBLISHED, READINGS_SUPPRESSED,
+            BODY_BYTES]
+
+
+def record_write(status, seconds):
+    """Record the outcome of one write."""
+    WRITE_RESPONSES.inc('error' if status is None else status)
+    WRITE_LATENCY.observe(seconds)
+
+
+def render():
+    """Render all metrics in the Prometheus text format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    # Token required in the X-Admin-Token header of /debug/profile; without one it does not exist
+    admin_token = ''
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/metrics':
+            self.send_text(render(), 'text/plain; version=0.0.4; charset=utf-8')
+        elif url.path == '/debug/profile' and self.authorized():
+            self.send_profile(parse_qs(url.query))
+        else:
+            self.send_error(404)
+
+    def authorized(self):
+        """Return True if the request carries the admin token (header only, query strings get logged)."""
+        token = self.headers.get('X-Admin-Token', '')
+        return bool(self.admin_token) and hmac.compare_digest(token.encode('utf-8'), self.admin_token.encode('utf-8'))
+
+    def send_profile(self, query):
+        """Sample the live process for ?seconds= (default 10) every ?interval= ms and return folded stacks."""
+        try:
+            seconds = float(query.get('seconds', ['10'])[0])
+            interval = float(query.get('interval', ['5'])[0]) / 1000
+        except ValueError:
+            self.send_error(400, 'seconds and interval must be numbers')
+            return
+        if seconds <= 0 or interval <= 0:
+            self.send_error(400, 'seconds and interval must be positive')
+            return
+        logger.info(f"🔬 Profiling for {seconds:g}s")
+        folded = PROFILER.profile(seconds, interval)
+        if folded is None:
+            self.send_error(409, 'a profile is already running')
+            return
+        self.send_text(folded, 'text/plain; charset=utf-8')
+
+    def send_text(self, text, content_type):
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes are not worth a log line each
+
+
+def start_metrics_server(port, profiling=False, admin_token=None):
+    """Serve /metrics (and /debug/profile if profiling, to holders of admin_token) from a daemon thread."""
+    if profiling and not admin_token:
+        logger.warning("⚠️ Profiling needs metrics.admin_token, /debug/profile stays off")
+    handler = type('Handler', (MetricsHandler,), {'admin_token': (admin_token or '') if profiling else ''})
+    server = ThreadingHTTPServer(('0.0.0.0', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"📈 Metrics available on :{port}/metrics")
+    if profiling and admin_token:
+        logger.info(f"🔬 Sampling profiles available on :{port}/debug/profile?seconds=10")
+    return server
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Bulk provisioning for the Temperature Sensor Service
+Verifies and creates the simulated things concurrently, under one shared policy, before readings start
+"""
+
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime
+
+from transports import HttpTransport
+from statuses import is_transient
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Things per in(thingId,...) search; keeps the request URL well below common limits
+SEARCH_CHUNK = 100
+CREATED = [200, 201, 204]
+# Answer to a conditional create (If-None-Match: *) when the entity already exists
+EXISTS = 412
+
+
+def backoff_delay(attempt, initial, maximum):
+    """Return a random delay of up to initial * 2^attempt seconds, capped at maximum (full jitter)."""
+    return random.uniform(0, min(maximum, initial * 2 ** attempt))
+
+
+def thing_json(policy_id=None):
+    """Return the initial state of a simulated thing, governed by policy_id or an implicit policy of its own."""
+    thing = {
+        "definition": "demo:sensor:1.0.0",
+        "attributes": {
+            "name": "Temperature Sensor"
+        },
+        "features": {
+            "temp": {
+                "properties": {
+                    "value": 25.0,
+                    "unit": "celsius",
+                    "timestamp": datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                    "status": "active"
+                }
+            }
+        }
+    }
+    if policy_id:
+        thing["policyId"] = policy_id
+    return thing
+
+
+def policy_json(subject):
+    """Return a policy granting subject full access to the things, policy and messages it governs."""
+    grant = {"grant": ["READ", "WRITE"], "revoke": []}
+    return {
+        "entries": {
+            "owner": {
+                "subjects": {
+                    subject: {"type": "sensor simulator"}
+                },
+                "resources": {
+                    "thing:/": grant,
+                    "policy:/": grant,
+                    "message:/": grant
+                }
+            }
+        }
+    }
+
+
+class Provisioner:
+    def __init__(self, config):
+        """Initialize the provisioner from the sensor configuration."""
+        provisioning = config.get('provisioning', {})
+        # Always REST, whatever transport the readings use; connections are pooled per the fleet settings
+        self.transport = HttpTransport(config)
+        self.workers = provisioning.get('workers', 64)
+        self.policy_id = provisioning.get('policy_id')
+        self.policy_subject = provisioning.get('policy_subject') or f"nginx:{config['username']}"
+        self.max_attempts = provisioning.get('max_attempts', 6)
+        self.backoff_initial = provisioning.get('backoff_initial', 0.5)
+        self.backoff_max = provisioning.get('backoff_max', 30)
+        self.stats = {
+            'existing': 0,
+            'created': 0,
+            'failed': 0,
+            'retries': 0
+        }
+
+    async def with_backoff(self, call, failed=is_transient):
+        """Call until failed(result) is false or attempts run out, sleeping with jittered backoff in between."""
+        for attempt in range(self.max_attempts):
+            result = await call()
+            if not failed(result) or attempt == self.max_attempts - 1:
+                return result
+            self.stats['retries'] += 1
+            await asyncio.sleep(backoff_delay(attempt, self.backoff_initial, self.backoff_max))
+        return None
+
+    async def ensure_policy(self):
+        """Create the shared policy if it is missing; without it, things fall back to implicit policies."""
+        if not self.policy_id:
+            return
+        status = await self.with_backoff(
+            lambda: self.transport.create_policy(self.policy_id, policy_json(self.policy_subject)))
+        if status in CREATED:
+            logger.info(f"🔐 Created shared policy {self.policy_id} for {self.policy_subject}")
+        elif status != EXISTS:
+            logger.warning(f"⚠️ Could not create policy {self.policy_id} ({status}), using implicit policies")
+            self.policy_id = None
+
+    async def existing(self, thing_ids):
+        """Return the things that already exist, looked up by search in chunks."""
+        found = set()
+        for start in range(0, len(thing_ids), SEARCH_CHUNK):
+            chunk = thing_ids[start:start + SEARCH_CHUNK]
+            quoted = ','.join(f'"{thing_id}"' for thing_id in chunk)
+            matches = await self.with_backoff(lambda: self.transport.search_thing_ids(f"in(thingId,{quoted})"),
+                                              failed=lambda result: result is None)
+            if matches is None:
+                # Not fatal: the conditional creates below tell existing things apart as well
+                logger.warning("⚠️ Thing search failed, checking every thing by creating it conditionally")
+                return found
+            found.update(matches.intersection(chunk))
+        return found
+
+    async def create(self, thing_id):
+        """Create one thing unless it exists; returns True once it exists."""
+        status = await self.with_backoff(
+            lambda: self.transport.create_thing(thing_id, thing_json(self.policy_id), if_absent=True))
+        if status == EXISTS:
+            self.stats['existing'] += 1
+            return True
+        if status in CREATED:
+            self.stats['created'] += 1
+            metrics.THINGS_CREATED.inc()
+            return True
+        self.stats['failed'] += 1
+        logger.warning(f"⚠️ Could not create {thing_id}: {status}")
+        return False
+
+    async def worker(self, queue, ready):
+        while True:
+            try:
+                thing_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if await self.create(thing_id):
+                ready.add(thing_id)
+
+    async def provision(self, thing_ids):
+        """Make sure all things exist and return the set of those that do."""
+        started = time.monotonic()
+        await self.transport.start()
+        try:
+            with tracing.span('sensor.provision', things=len(thing_ids)) as span:
+                await self.ensure_policy()
+                ready = await self.existing(thing_ids)
+                self.stats['existing'] += len(ready)
+                queue = asyncio.Queue()
+                for thing_id in thing_ids:
+                    if thing_id not in ready:
+                        queue.put_nowait(thing_id)
+                # A bounded pool of workers, so a large fleet never opens more requests than the pool holds
+                await asyncio.gather(*(self.worker(queue, ready)
+                                       for _ in range(min(self.workers, queue.qsize()))))
+                for key, value in self.stats.items():
+                    span.set(key, value)
+        finally:
+            await self.transport.close()
+        logger.info(f"🏗️ Provisioned {len(ready)}/{len(thing_ids)} things in {time.monotonic() - started:.1f}s: "
+                    f"{self.stats['existing']} existing, {self.stats['created']} created, "
+                    f"{self.stats['failed']} failed, {self.stats['retries']} retries")
+        return ready
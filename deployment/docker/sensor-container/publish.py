@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Report-by-exception publishing for the Temperature Sensor Service
+Writes a reading only when it left the deadband around the last published value or a heartbeat is due
+"""
+
+import time
+
+import metrics
+
+PROPERTIES_PATH = "/features/temp/properties"
+VALUE_PATH = "/features/temp/properties/value"
+
+
+class PublishPolicy:
+    def __init__(self, deadband=0.2, deadband_type='absolute', min_interval=0, max_interval=300, value_only=True):
+        """Initialize the policy; deadband is in degrees or, for deadband_type 'percent', percent of the last value."""
+        if deadband_type not in ('absolute', 'percent'):
+            raise ValueError(f"deadband_type must be 'absolute' or 'percent', not {deadband_type!r}")
+        if max_interval and max_interval < min_interval:
+            raise ValueError("max_interval must not be shorter than min_interval")
+        self.deadband = deadband
+        self.deadband_type = deadband_type
+        self.min_interval = min_interval
+        # Heartbeat: even an unchanged value is written this often, 0 disables it
+        self.max_interval = max_interval
+        self.value_only = value_only
+
+        # thing_id -> (last published value, monotonic time it was published)
+        self.published = {}
+        self.stats = {
+            'initial': 0,
+            'change': 0,
+            'heartbeat': 0,
+            'deadband': 0,
+            'min_interval': 0
+        }
+
+    def exceeds_deadband(self, last, value):
+        """Return True if value moved further from last than the deadband allows."""
+        change = abs(value - last)
+        if self.deadband_type == 'percent':
+            return change > abs(last) * self.deadband / 100
+        return change > self.deadband
+
+    def decide(self, thing_id, value, now=None):
+        """Return why a reading is written ('initial', 'change' or 'heartbeat'), or None to suppress it.
+
+        A written reading becomes the new reference value right away; call forget() if its write fails."""
+        if now is None:
+            now = time.monotonic()
+        last = self.published.get(thing_id)
+        if last is None:
+            reason = 'initial'
+        else:
+            last_value, last_time = last
+            elapsed = now - last_time
+            if elapsed < self.min_interval:
+                reason = None
+                self.suppress('min_interval')
+            elif self.max_interval and elapsed >= self.max_interval:
+                reason = 'heartbeat'
+            elif self.exceeds_deadband(last_value, value):
+                reason = 'change'
+            else:
+                reason = None
+                self.suppress('deadband')
+        if reason is not None:
+            self.published[thing_id] = (value, now)
+            self.stats[reason] += 1
+            metrics.READINGS_PUBLISHED.inc(reason)
+        return reason
+
+    def suppress(self, reason):
+        self.stats[reason] += 1
+        metrics.READINGS_SUPPRESSED.inc(reason)
+
+    def forget(self, thing_id):
+        """Drop a thing's reference value, so its next reading is written in full."""
+        self.published.pop(thing_id, None)
+
+    def value_only_write(self, reason):
+        """Return True if a reading let through for reason writes only its value.
+
+        The first reading of a thing writes all temp properties, so unit and status are set."""
+        return self.value_only and reason != 'initial'
+
+    def describe(self):
+        unit = '%' if self.deadband_type == 'percent' else '°C'
+        heartbeat = f"{self.max_interval}s" if self.max_interval else "off"
+        return (f"deadband ±{self.deadband}{unit}, min interval {self.min_interval}s, heartbeat {heartbeat}"
+                f"{', value only' if self.value_only else ''}")
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Trace replay mode for the Temperature Sensor Service
+Streams recorded CSV/NDJSON telemetry into Ditto, preserving (scaled) inter-arrival times
+"""
+
+import csv
+import os
+import json
+import mmap
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from fleet import FleetSimulator
+from statuses import WRITTEN
+
+logger = logging.getLogger(__name__)
+
+
+def parse_timestamp(raw):
+    """Parse epoch seconds, epoch milliseconds or ISO 8601 into epoch seconds."""
+    try:
+        value = float(raw)
+        return value / 1000 if value > 1e11 else value
+    except (TypeError, ValueError):
+        parsed = datetime.fromisoformat(str(raw).replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+
+def parse_value(raw):
+    """Turn CSV cells into numbers where possible."""
+    if isinstance(raw, str):
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+class TraceReplayer(FleetSimulator):
+    def __init__(self, config):
+        """Initialize the replay from the 'replay' section of the sensor configuration."""
+        super().__init__(config, thing_ids=[])
+        replay = config.get('replay', {})
+        self.path = replay.get('path', 'trace.csv')
+        self.format = replay.get('format', 'auto')
+        if self.format == 'auto':
+            self.format = 'ndjson' if self.path.endswith(('.ndjson', '.jsonl')) else 'csv'
+        self.speed = replay.get('speed', 1.0)
+        self.thing_id_column = replay.get('thing_id_column', 'thing_id')
+        self.default_thing_id = replay.get('thing_id', config['thing_id'])
+        self.timestamp_column = replay.get('timestamp_column', 'timestamp')
+        self.feature = replay.get('feature', 'temp')
+        self.property_columns = replay.get('property_columns', {'value': 'value'})
+
+        self.stats['records'] = 0
+        self.stats['skipped'] = 0
+        self.stats['max_lag_ms'] = 0
+        # One lock per thing keeps its writes in trace order under concurrency
+        self.thing_locks = {}
+
+        pace = "as fast as possible" if not self.speed else f"at {self.speed}x speed"
+        logger.info(f"📼 Replaying {self.format} trace {self.path} {pace}")
+
+    def read_lines(self):
+        """Yield the lines of the trace, line endings included, lazily from a memory-mapped file."""
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return  # mmap refuses empty files
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for line in iter(mm.readline, b''):
+                    yield line.decode('utf-8')
+
+    def read_rows(self):
+        """Yield each trace record as a dict of column name to value."""
+        lines = self.read_lines()
+        if self.format == 'ndjson':
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                if isinstance(row, dict):
+                    yield row
+                else:
+                    logger.debug(f"Skipping malformed trace line: {line[:200]}")
+                    self.stats['skipped'] += 1
+            return
+        # The reader pulls further lines itself when a quoted field spans several
+        yield from csv.DictReader(lines)
+
+    def read_records(self):
+        """Yield (epoch seconds, thing_id, properties) for every trace record with a timestamp."""
+        for row in self.read_rows():
+            try:
+                timestamp = parse_timestamp(row[self.timestamp_column])
+            except (KeyError, ValueError):
+                logger.debug(f"Skipping trace record without a valid {self.timestamp_column}: {row}")
+                self.stats['skipped'] += 1
+                continue
+            properties = {prop: parse_value(row[column])
+                          for prop, column in self.property_columns.items() if column in row}
+            properties['timestamp'] = datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+            yield timestamp, row.get(self.thing_id_column, self.default_thing_id), properties
+
+    async def replay_record(self, thing_id, properties):
+        """Merge one record into its thing, after earlier records of that thing."""
+        lock = self.thing_locks.setdefault(thing_id, asyncio.Lock())
+        async with lock:
+            status = await self.deliver(thing_id, f"/features/{self.feature}/properties", properties, merge=True)
+        if status in WRITTEN:
+            self.stats['sent'] += 1
+        else:
+            logger.debug(f"Failed to replay record for {thing_id}: {status}")
+            self.stats['failed'] += 1
+
+    async def run(self):
+        """Stream the trace into Ditto and wait for all writes to finish."""
+        loop = asyncio.get_running_loop()
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        await self.transport.start()
+        reporter = asyncio.create_task(self.report_stats())
+        pending = set()
+        first_timestamp = None
+        started = None
+        try:
+            for timestamp, thing_id, properties in self.read_records():
+                if self.speed:
+                    if first_timestamp is None:
+                        first_timestamp, started = timestamp, loop.time()
+                    delay = started + (timestamp - first_timestamp) / self.speed - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    else:
+                        self.stats['max_lag_ms'] = max(self.stats['max_lag_ms'], int(-delay * 1000))
+
+                # Bound the records read ahead of the transport
+                if len(pending) >= self.max_concurrency:
+                    await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                task = asyncio.create_task(self.replay_record(thing_id, properties))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                self.stats['records'] += 1
+
+            if pending:
+                await asyncio.wait(pending)
+            logger.info(f"🏁 Replay finished: {self.stats['records']} records, sent={self.stats['sent']} "
+                        f"failed={self.stats['failed']} skipped={self.stats['skipped']}, max lag {self.stats['max_lag_ms']}ms")
+        finally:
+            self.running = False
+            reporter.cancel()
+            await asyncio.gather(reporter, return_exceptions=True)
+            await self.transport.close()
+
+    def run_simulation(self):
+        """Run the replay on a fresh event loop."""
+        logger.info("🚀 Starting trace replay...")
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            logger.info("🛑 Trace replay stopped by user")
@@ -5,13 +5,22 @@ This runs in a separate container to simulate a VM environment
 """
 
 import requests
+import asyncio
 import json
 import time
 import random
+import math
 import os
 from datetime import datetime
 import logging
 
+from journal import ReadingJournal, ReplayPacer
+from publish import PublishPolicy, PROPERTIES_PATH, VALUE_PATH
+from encoding import BodyEncoder
+from statuses import WRITTEN, is_transient
+import metrics
+import tracing
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -27,19 +36,70 @@ class TemperatureSensor:
         self.thing_id = self.config['thing_id']
         self.update_interval = self.config['update_interval']
         self.temp_range = self.config['temp_range']
+        self.verify_sample_rate = self.config['verify_sample_rate']
+        
+        # Realistic signals need NumPy, the uniform generator does not
+        self.signal_engine = None
+        if self.config['signal'].get('engine') == 'realistic':
+            from signals import SignalEngine
+            self.signal_engine = SignalEngine(1, self.temp_range, self.config['signal'], self.update_interval)
+        
+        # Things confirmed to exist; only a 404 on write invalidates an entry
+        self.known_things = set()
+        # Shared policy of the simulated things, once provisioning made sure it exists
+        self.policy_id = None
+        self.write_count = 0
+        
+        # Store-and-forward journal for readings Ditto could not take
+        store = self.config['store_and_forward']
+        self.journal = None
+        if store.get('enabled'):
+            self.journal = ReadingJournal(store['journal_path'], store.get('max_bytes', 50 * 1024 * 1024))
+            self.replay_pacer = ReplayPacer(store.get('replay_rate', 50))
+            metrics.BACKLOG_DEPTH.set_function(self.journal.depth)
+        
+        # Report-by-exception: only readings outside the deadband are written, plus heartbeats
+        publish = self.config['publish']
+        self.publish_policy = None
+        if publish.get('enabled'):
+            self.publish_policy = PublishPolicy(
+                deadband=publish.get('deadband', 0.2),
+                deadband_type=publish.get('deadband_type', 'absolute'),
+                min_interval=publish.get('min_interval', 0),
+                max_interval=publish.get('max_interval', 300),
+                value_only=publish.get('value_only', True)
+            )
+        
+        # Per-reading log lines: 'all', 'sampled' (1 in log_sample_rate) or 'aggregate'
+        logging_config = self.config['logging']
+        self.log_readings = logging_config.get('readings', 'all')
+        self.log_sample_rate = logging_config.get('sample_rate', 100)
+        self.log_aggregate_interval = logging_config.get('aggregate_interval', 60)
+        self.reading_count = 0
+        self.last_aggregate = (time.monotonic(), 0, 0)
         
         # Set up authentication
         self.auth = (self.config['username'], self.config['password'])
+        self.encoder = BodyEncoder(self.config['body_encoding'])
         
         logger.info(f"🌡️  Temperature Sensor Service Started")
         logger.info(f"📡 Target: {self.thing_id}")
         logger.info(f"🔗 API: {self.base_url}")
         logger.info(f"⏱️  Interval: {self.update_interval}s")
         logger.info(f"🌡️  Range: {self.temp_range['min']}-{self.temp_range['max']}°C")
+        if self.verify_sample_rate:
+            logger.info(f"🔎 Verifying 1 in {self.verify_sample_rate} writes")
+        if self.journal:
+            logger.info(f"📼 Buffering unsent readings in {self.journal.path}")
+        if self.publish_policy:
+            logger.info(f"🔇 Report by exception: {self.publish_policy.describe()}")
     
     def load_config(self, config_file):
         """Load configuration from JSON file."""
         default_config = {
+            "mode": "single",
+            "transport": "http",
+            "body_encoding": "json",
             "thing_id": "demo:sensor-1",
             "update_interval": 5,
             "temp_range": {
@@ -48,7 +108,92 @@ class TemperatureSensor:
             },
             "ditto_api_url": "http://nginx:80",  # Use nginx service name
             "username": "ditto",
-            "password": "ditto"
+            "password": "ditto",
+            "verify_sample_rate": 100,
+            "fleet": {
+                "thing_id_pattern": "demo:sensor-{index}",
+                "start_index": 1,
+                "count": 100,
+                "max_concurrency": 500,
+                "connection_pool_size": 200,
+                "request_timeout": 10,
+                "stats_interval": 10
+            },
+            "websocket": {
+                "url": None,
+                "response_required": True,
+                "max_in_flight": 1000,
+                "response_timeout": 10,
+                "max_queued": 100000,
+                "reconnect_backoff_min": 1,
+                "reconnect_backoff_max": 30
+            },
+            "batching": {
+                "enabled": False,
+                "window_seconds": None,
+                "max_readings": 1000
+            },
+            "store_and_forward": {
+                "enabled": False,
+                "journal_path": "sensor_journal.db",
+                "max_bytes": 52428800,
+                "replay_rate": 50
+            },
+            "provisioning": {
+                "enabled": True,
+                "workers": 64,
+                "policy_id": "demo:sensor-policy",
+                "policy_subject": None,
+                "max_attempts": 6,
+                "backoff_initial": 0.5,
+                "backoff_max": 30
+            },
+            "publish": {
+                "enabled": False,
+                "deadband": 0.2,
+                "deadband_type": "absolute",
+                "min_interval": 0,
+                "max_interval": 300,
+                "value_only": True
+            },
+            "benchmark": {
+                "target_rate": 1000,
+                "duration": 60,
+                "warmup": 5,
+                "max_outstanding": 10000,
+                "report_path": "benchmark_report.json"
+            },
+            "signal": {
+                "engine": "uniform",
+                "seed": None
+            },
+            "metrics": {
+                "enabled": False,
+                "port": 9100,
+                "profiling": False,
+                "admin_token": None
+            },
+            "tracing": {
+                "enabled": False,
+                "path": "sensor_traces.jsonl",
+                "sample_rate": 1.0
+            },
+            "logging": {
+                "readings": "all",
+                "sample_rate": 100,
+                "aggregate_interval": 60
+            },
+            "replay": {
+                "path": "trace.csv",
+                "format": "auto",
+                "speed": 1.0,
+                "thing_id_column": "thing_id",
+                "timestamp_column": "timestamp",
+                "feature": "temp",
+                "property_columns": {
+                    "value": "value"
+                }
+            }
         }
         
         try:
@@ -67,17 +212,24 @@ class TemperatureSensor:
             return default_config
     
     def generate_temperature(self):
-        """Generate a random temperature reading."""
+        """Generate a temperature reading, or None if the simulated sensor dropped out."""
+        if self.signal_engine is not None:
+            temp = float(self.signal_engine.next_batch()[0])
+            return None if math.isnan(temp) else temp
         temp = round(random.uniform(self.temp_range['min'], self.temp_range['max']), 1)
         return temp
     
-    def ensure_thing_exists(self):
+    def ensure_thing_exists(self, force=False):
         """Auto-create thing if it doesn't exist"""
+        if not force and self.thing_id in self.known_things:
+            return True
+        
         try:
             url = f"{self.base_url}/api/2/things/{self.thing_id}"
             response = requests.get(url, auth=self.auth, timeout=5)
             
             if response.status_code == 200:
+                self.known_things.add(self.thing_id)
                 return True  # Thing exists
             elif response.status_code == 404:
                 # Thing doesn't exist - create it
@@ -98,6 +250,8 @@ class TemperatureSensor:
                         }
                     }
                 }
+                if self.policy_id:
+                    thing_json["policyId"] = self.policy_id
                 
                 # Try gateway directly (bypass nginx) - use internal Docker network
                 gateway_url = "http://gateway:8080/api/2/things/" + self.thing_id
@@ -115,6 +269,8 @@ class TemperatureSensor:
                     
                     if create_response.status_code in [200, 201, 204]:
                         logger.info(f"✅ Thing {self.thing_id} auto-created via gateway successfully")
+                        self.known_things.add(self.thing_id)
+                        metrics.THINGS_CREATED.inc()
                         return True
                     else:
                         logger.warning(f"⚠️ Gateway creation failed: {create_response.status_code}")
@@ -133,6 +289,8 @@ class TemperatureSensor:
                 
                 if create_response.status_code in [200, 201, 204]:
                     logger.info(f"✅ Thing {self.thing_id} auto-created successfully")
+                    self.known_things.add(self.thing_id)
+                    metrics.THINGS_CREATED.inc()
                     return True
                 else:
                     logger.warning(f"⚠️ Could not auto-create thing: {create_response.status_code} - {create_response.text[:200]}")
@@ -143,10 +301,30 @@ class TemperatureSensor:
             logger.error(f"❌ Error checking/creating thing: {e}")
             return False
     
+    def provision(self):
+        """Create the thing (and the shared policy) if missing, retrying with backoff; True once it exists."""
+        if not self.config['provisioning'].get('enabled', True):
+            return self.ensure_thing_exists()
+        # Imported lazily, like fleet mode: provisioning runs on aiohttp
+        from provisioning import Provisioner
+        provisioner = Provisioner(self.config)
+        self.known_things |= asyncio.run(provisioner.provision([self.thing_id]))
+        self.policy_id = provisioner.policy_id
+        return self.thing_id in self.known_things
+    
     def send_temperature_reading(self, temperature):
         """Send temperature reading to Ditto."""
-        # Ensure thing exists first
-        self.ensure_thing_exists()
+        # Ensure thing exists first (no request once the thing is known)
+        if self.thing_id not in self.known_things:
+            with tracing.span('ditto.ensure_thing', tracing.CLIENT, thing=self.thing_id):
+                self.ensure_thing_exists()
+        
+        reason = None
+        if self.publish_policy:
+            reason = self.publish_policy.decide(self.thing_id, temperature)
+            if reason is None:
+                self.log_reading(f"🔇 Temperature {temperature}°C within the deadband, not sent")
+                return False
         
         timestamp = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
         
@@ -158,21 +336,44 @@ class TemperatureSensor:
             "status": "active"
         }
         
+        if self.journal and self.journal.depth(self.thing_id):
+            # Never let a fresh reading overtake older ones still waiting in the journal
+            with tracing.span('journal.append', reason='backlog'):
+                self.journal.append(self.thing_id, PROPERTIES_PATH, data)
+            self.log_reading(f"📼 Temperature {temperature}°C queued behind {self.journal.depth(self.thing_id) - 1} buffered readings")
+            return False
+        
+        value_only = reason is not None and self.publish_policy.value_only_write(reason)
+        success = self.write_properties(data, value_only=value_only)
+        if success is None and self.journal:
+            # Buffered in full, so the replayed reading also carries its timestamp
+            with tracing.span('journal.append', reason='unreachable'):
+                self.journal.append(self.thing_id, PROPERTIES_PATH, data)
+            logger.warning(f"📼 Temperature {temperature}°C buffered for later delivery")
+        elif not success and self.publish_policy:
+            # Next reading is written in full, whatever the deadband says
+            self.publish_policy.forget(self.thing_id)
+        return bool(success)
+    
+    def write_properties(self, data, retry_on_missing=True, value_only=False):
+        """PUT temp properties, or only their value; returns True, False (rejected) or None (Ditto unreachable)."""
+        temperature = data['value']
+        
         # Construct the API endpoint
-        url = f"{self.base_url}/api/2/things/{self.thing_id}/features/temp/properties"
+        path = VALUE_PATH if value_only else PROPERTIES_PATH
+        url = f"{self.base_url}/api/2/things/{self.thing_id}{path}"
         
+        started = time.monotonic()
         try:
             # Send PUT request to update the temperature
-            response = requests.put(
-                url,
-                json=data,
-                auth=self.auth,
-                headers={'Content-Type': 'application/json'},
-                timeout=10
-            )
+            with tracing.span('ditto.write', tracing.CLIENT, thing=self.thing_id, retry=not retry_on_missing) as span:
+                response = self.put(url, temperature if value_only else data)
+                span.set('http.status_code', response.status_code)
+            metrics.record_write(response.status_code, time.monotonic() - started)
             
-            if response.status_code in [200, 204]:
-                logger.info(f"✅ Temperature {temperature}°C sent successfully")
+            if response.status_code in WRITTEN:
+                metrics.READINGS_SENT.inc()
+                self.log_reading(f"✅ Temperature {temperature}°C sent successfully")
                 return True
             elif response.status_code == 401:
                 logger.error("❌ Authentication failed - check credentials")
@@ -181,27 +382,103 @@ class TemperatureSensor:
                 logger.error("❌ Access forbidden - insufficient permissions")
                 return False
             elif response.status_code == 404:
+                # The thing was deleted behind our back - forget it and recreate once
+                self.known_things.discard(self.thing_id)
+                if retry_on_missing:
+                    with tracing.span('sensor.recreate_and_retry', thing=self.thing_id):
+                        if self.ensure_thing_exists(force=True):
+                            metrics.WRITE_RETRIES.inc()
+                            return self.write_properties(data, retry_on_missing=False, value_only=value_only)
                 logger.error("❌ Thing or feature not found - check if Digital Twin exists")
                 return False
             else:
                 logger.error(f"❌ Failed to send temperature: {response.status_code} - {response.text}")
-                return False
+                # Overload and server errors are worth retrying, other client errors are not
+                return None if is_transient(response.status_code) else False
                 
         except requests.exceptions.RequestException as e:
+            metrics.record_write(None, time.monotonic() - started)
             logger.error(f"❌ Network error: {e}")
-            return False
+            return None
+    
+    def put(self, url, value):
+        """PUT a value in the configured body encoding, and once more as JSON if Ditto rejects the encoding."""
+        body, content_type = self.encoder.encode(value)
+        response = requests.put(url, data=body, auth=self.auth, headers={'Content-Type': content_type}, timeout=10)
+        if self.encoder.rejected(response.status_code):
+            return self.put(url, value)
+        return response
+    
+    def log_reading(self, message):
+        """Log a per-reading line according to the logging.readings policy."""
+        if self.log_readings == 'all':
+            logger.info(message)
+        elif self.log_readings == 'sampled' and self.reading_count % self.log_sample_rate == 0:
+            logger.info(message)
+    
+    def log_aggregate(self):
+        """In aggregate logging mode, summarize readings once per aggregate_interval."""
+        if self.log_readings != 'aggregate':
+            return
+        now = time.monotonic()
+        since, generated_before, sent_before = self.last_aggregate
+        if now - since < self.log_aggregate_interval:
+            return
+        generated = metrics.READINGS_GENERATED.get()
+        sent = metrics.READINGS_SENT.get()
+        logger.info(f"📊 Last {now - since:.0f}s: {generated - generated_before} readings generated, "
+                    f"{sent - sent_before} sent")
+        self.last_aggregate = (now, generated, sent)
+    
+    def replay_journal(self, budget):
+        """Replay buffered readings in order, paced by replay_rate, for at most budget seconds."""
+        with tracing.span('journal.replay') as span:
+            replayed = self.replay_entries(budget)
+            span.set('replayed', replayed)
+        if replayed:
+            logger.info(f"📼 Replayed {replayed} buffered readings, {self.journal.depth()} still buffered")
+        return replayed
+    
+    def replay_entries(self, budget):
+        """Write buffered readings until the journal is empty, Ditto fails or budget runs out."""
+        deadline = time.monotonic() + budget
+        replayed = 0
+        while time.monotonic() < deadline:
+            entries = self.journal.oldest(limit=10)
+            if not entries:
+                break
+            for entry_id, thing_id, path, data in entries:
+                delay = self.replay_pacer.delay()
+                if time.monotonic() + delay >= deadline:
+                    return replayed
+                time.sleep(delay)
+                success = self.write_properties(data)
+                if success is None:
+                    return replayed  # Ditto still unreachable, keep the backlog
+                # Readings Ditto rejects outright would block the journal forever
+                self.journal.remove(entry_id, replayed=success)
+                if success:
+                    replayed += 1
+        return replayed
+    
+    def should_verify(self):
+        """Return True if the current write is sampled for read-back verification."""
+        self.write_count += 1
+        return bool(self.verify_sample_rate) and self.write_count % self.verify_sample_rate == 0
     
     def get_current_temperature(self):
         """Get current temperature from Ditto."""
         url = f"{self.base_url}/api/2/things/{self.thing_id}/features/temp/properties"
         
         try:
-            response = requests.get(
-                url,
-                auth=self.auth,
-                headers={'Accept': 'application/json'},
-                timeout=10
-            )
+            with tracing.span('ditto.verify', tracing.CLIENT, thing=self.thing_id) as span:
+                response = requests.get(
+                    url,
+                    auth=self.auth,
+                    headers={'Accept': 'application/json'},
+                    timeout=10
+                )
+                span.set('http.status_code', response.status_code)
             
             if response.status_code == 200:
                 data = response.json()
@@ -240,41 +517,50 @@ class TemperatureSensor:
         
         # Test connection first
         if not self.test_connection():
-            logger.error("❌ Cannot connect to Ditto. Exiting.")
-            return
+            if not self.journal:
+                logger.error("❌ Cannot connect to Ditto. Exiting.")
+                return
+            logger.warning("📼 Ditto not reachable yet, buffering readings until it is")
         
         # Ensure thing exists before starting simulation
         logger.info("🔧 Ensuring thing exists...")
-        max_retries = 5
-        for attempt in range(max_retries):
-            if self.ensure_thing_exists():
-                logger.info("✅ Thing ready, starting simulation...")
-                break
-            else:
-                if attempt < max_retries - 1:
-                    logger.warning(f"⚠️  Thing creation failed, retrying in 5 seconds... (attempt {attempt + 1}/{max_retries})")
-                    time.sleep(5)
-                else:
-                    logger.error("❌ Could not create thing after multiple attempts. Continuing anyway...")
+        if self.provision():
+            logger.info("✅ Thing ready, starting simulation...")
+        else:
+            logger.error("❌ Could not create thing after multiple attempts. Continuing anyway...")
         
         try:
             while True:
-                # Generate new temperature reading
-                temperature = self.generate_temperature()
-                logger.info(f"🌡️  Generated temperature: {temperature}°C")
+                # One trace per reading: generation, delivery (with retries) and verification
+                with tracing.span('sensor.reading', thing=self.thing_id) as reading:
+                    # Generate new temperature reading
+                    with tracing.span('sensor.generate'):
+                        temperature = self.generate_temperature()
+                    if temperature is not None:
+                        reading.set('value', temperature)
+                        self.reading_count += 1
+                        metrics.READINGS_GENERATED.inc()
+                        self.log_reading(f"🌡️  Generated temperature: {temperature}°C")
+                        self.log_aggregate()
+                        
+                        # Send to Ditto
+                        success = self.send_temperature_reading(temperature)
+                        
+                        # Verify a sample of the updates (a missing thing is recreated on write)
+                        if success and self.should_verify():
+                            self.get_current_temperature()
                 
-                # Send to Ditto
-                success = self.send_temperature_reading(temperature)
+                if temperature is None:
+                    logger.info("📴 Sensor dropout, no reading this tick")
+                    time.sleep(self.update_interval)
+                    continue
                 
-                if success:
-                    # Verify the update
-                    time.sleep(1)  # Wait a moment
-                    self.get_current_temperature()
-                else:
-                    # If send failed, try to recreate thing
-                    if attempt % 10 == 0:  # Every 10 failed attempts
-                        logger.warning("⚠️  Multiple failures, attempting to recreate thing...")
-                        self.ensure_thing_exists()
+                # Drain buffered readings within the time left until the next reading
+                if self.journal and self.journal.depth():
+                    started = time.monotonic()
+                    self.replay_journal(self.update_interval)
+                    time.sleep(max(0, self.update_interval - (time.monotonic() - started)))
+                    continue
                 
                 # Wait for next reading
                 time.sleep(self.update_interval)
@@ -292,8 +578,35 @@ def main():
     # Initialize sensor
     sensor = TemperatureSensor()
     
+    tracing_config = sensor.config['tracing']
+    if tracing_config.get('enabled'):
+        tracing.configure('temperature-sensor', tracing_config.get('path', 'sensor_traces.jsonl'),
+                          tracing_config.get('sample_rate', 1.0))
+    
+    if sensor.config['metrics'].get('enabled'):
+        metrics.start_metrics_server(sensor.config['metrics'].get('port', 9100),
+                                     profiling=sensor.config['metrics'].get('profiling', False),
+                                     admin_token=sensor.config['metrics'].get('admin_token'))
+    
     # Run simulation
-    sensor.run_simulation()
+    if sensor.config['mode'] == 'fleet':
+        # Imported lazily: aiohttp is only needed here and, in single mode, for provisioning
+        from fleet import FleetSimulator
+        FleetSimulator(sensor.config, journal=sensor.journal,
+                       publish_policy=sensor.publish_policy).run_simulation()
+    elif sensor.config['mode'] == 'replay':
+        from replay import TraceReplayer
+        TraceReplayer(sensor.config).run_simulation()
+    elif sensor.config['mode'] == 'benchmark':
+        from loadgen import OpenLoopLoadGenerator
+        OpenLoopLoadGenerator(sensor.config).run_benchmark()
+    elif sensor.config['transport'] == 'websocket' or sensor.config['batching'].get('enabled'):
+        # WebSocket transport and batching are asyncio based, drive the single thing as a fleet of one
+        from fleet import FleetSimulator
+        FleetSimulator(sensor.config, thing_ids=[sensor.thing_id], journal=sensor.journal,
+                       publish_policy=sensor.publish_policy).run_simulation()
+    else:
+        sensor.run_simulation()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Vectorized signal engine for simulated temperature sensors
+Generates one reading for every simulated thing per call with NumPy
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SignalEngine:
+    def __init__(self, count, temp_range, settings, update_interval=1.0):
+        """Initialize per-thing state for count sensors from the 'signal' settings."""
+        self.count = count
+        self.dt = update_interval
+        self.rng = np.random.default_rng(settings.get('seed'))
+
+        low, high = temp_range['min'], temp_range['max']
+        span = high - low
+        self.ar_phi = settings.get('ar_phi', 0.95)
+        self.ar_sigma = settings.get('ar_sigma', 0.02 * span)
+        self.diurnal_amplitude = settings.get('diurnal_amplitude', 0.15 * span)
+        self.diurnal_period = settings.get('diurnal_period', 86400)
+        self.noise_sigma = settings.get('noise_sigma', 0.005 * span)
+        self.spike_probability = settings.get('spike_probability', 0.001)
+        self.spike_magnitude = settings.get('spike_magnitude', 0.4 * span)
+        self.stuck_probability = settings.get('stuck_probability', 0.0005)
+        self.stuck_duration = settings.get('stuck_duration', 60)
+        self.dropout_probability = settings.get('dropout_probability', 0.001)
+
+        # Each sensor gets its own operating point and daily phase
+        self.mean = self.rng.uniform(low + 0.3 * span, high - 0.3 * span, count)
+        self.phase = self.rng.uniform(0, 2 * np.pi, count)
+        self.deviation = np.zeros(count)
+        self.stuck_left = np.zeros(count, dtype=np.int64)
+        self.stuck_value = np.zeros(count)
+        self.step = 0
+
+    def next_batch(self):
+        """Advance all sensors by one tick; returns readings with NaN for dropped ones."""
+        rng = self.rng
+        n = self.count
+
+        # AR(1) random walk around each sensor's operating point
+        self.deviation = self.ar_phi * self.deviation + rng.normal(0, self.ar_sigma, n)
+
+        angle = 2 * np.pi * (self.step * self.dt) / self.diurnal_period + self.phase
+        values = self.mean + self.diurnal_amplitude * np.sin(angle) + self.deviation
+        values += rng.normal(0, self.noise_sigma, n)
+
+        spikes = rng.random(n) < self.spike_probability
+        values[spikes] += rng.choice([-1.0, 1.0], spikes.sum()) * self.spike_magnitude
+
+        # Stuck-at faults freeze a sensor on its last reading for stuck_duration ticks
+        starting = (self.stuck_left == 0) & (rng.random(n) < self.stuck_probability)
+        self.stuck_value[starting] = values[starting]
+        self.stuck_left[starting] = self.stuck_duration
+        stuck = self.stuck_left > 0
+        values[stuck] = self.stuck_value[stuck]
+        self.stuck_left[stuck] -= 1
+
+        values = np.round(values, 1)
+        values[rng.random(n) < self.dropout_probability] = np.nan
+        self.step += 1
+        return values
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""
+Ditto write statuses shared by the single-thing (requests) and asyncio (aiohttp) write paths
+"""
+
+# Ditto answers 202 when no response was requested, mirror that for the WebSocket
+ACCEPTED = 202
+TIMED_OUT = 408
+# Ditto's answer when overloaded; the WebSocket transport also rejects commands with it while its queue is full
+TOO_MANY_REQUESTS = 429
+# Statuses of a write that landed; 201 when it created the properties
+WRITTEN = [200, 201, 204, ACCEPTED]
+
+
+def is_transient(status):
+    """Return True if a write failed in a way worth retrying later (None means no connection)."""
+    return status is None or status in [TIMED_OUT, TOO_MANY_REQUESTS] or status >= 500
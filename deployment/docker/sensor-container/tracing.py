@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Span tracing and sampling profiles for the Temperature Sensor Service and the Digital Twin Dashboard
+Spans are exported as OTLP/JSON lines to a local file, profiles as folded stacks for flame graphs
+
+The same file is copied into sensor-container/ and dashboard/, because each is its own Docker build
+context; change both copies together (they must stay identical, `diff` them)
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import atexit
+import socket
+import logging
+import threading
+import contextvars
+from collections import Counter
+
+try:
+    from eventlet.patcher import original
+except ImportError:  # the sensor service runs without eventlet
+    os_threading, os_time = threading, time
+else:
+    # In a monkey-patched process the profiler still needs a real OS thread and a real sleep
+    os_threading, os_time = original('threading'), original('time')
+
+logger = logging.getLogger(__name__)
+
+INTERNAL = 1
+CLIENT = 3
+STATUS_ERROR = 2
+FLUSH_SPANS = 512
+FLUSH_INTERVAL = 5.0
+MAX_PROFILE_SECONDS = 60
+
+CURRENT_SPAN = contextvars.ContextVar('current_span', default=None)
+
+
+class NoopSpan:
+    """Stands in for a span while tracing is off or the trace is not sampled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, key, value):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class UnsampledSpan(NoopSpan):
+    """Root of a trace left out by sampling; its children are left out with it"""
+
+    __slots__ = ('token',)
+
+    def __enter__(self):
+        self.token = CURRENT_SPAN.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        CURRENT_SPAN.reset(self.token)
+        return False
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'kind', 'trace_id', 'span_id', 'parent_id', 'attributes',
+                 'start', 'end', 'error', 'token')
+
+    def __init__(self, tracer, name, kind, parent, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, key, value):
+        """Attach an attribute, e.g. a status only known at the end of the span"""
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.token = CURRENT_SPAN.set(self)
+        self.start = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.time_ns()
+        CURRENT_SPAN.reset(self.token)
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.tracer.finish(self)
+        return False
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end),
+            'attributes': otlp_attributes(self.attributes),
+            'status': {'code': STATUS_ERROR, 'message': self.error} if self.error else {}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def otlp_attributes(attributes):
+    return [{'key': key, 'value': otlp_value(value)} for key, value in attributes.items()]
+
+
+class Tracer:
+    def __init__(self):
+        """Start disabled; configure() turns tracing on"""
+        self.enabled = False
+        self.path = None
+        self.sample_rate = 1.0
+        self.resource = {}
+        self.pending = []
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def configure(self, service_name, path, sample_rate=1.0):
+        """Export spans of sample_rate of the traces to path, one OTLP/JSON request per line"""
+        self.enabled = bool(path)
+        self.path = path
+        self.sample_rate = sample_rate
+        self.resource = {'service.name': service_name, 'host.name': socket.gethostname(), 'process.pid': os.getpid()}
+        if self.enabled:
+            atexit.register(self.flush)
+            logger.info(f"Tracing {sample_rate:.0%} of traces to {path}")
+
+    def span(self, name, kind=INTERNAL, parent=None, **attributes):
+        """Open a span as a child of parent, by default of the current span"""
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is None:
+            parent = CURRENT_SPAN.get()
+        if isinstance(parent, NoopSpan):
+            return NOOP_SPAN
+        if parent is None and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return UnsampledSpan()
+        return Span(self, name, kind, parent, attributes)
+
+    def finish(self, span):
+        with self.lock:
+            self.pending.append(span)
+            due = len(self.pending) >= FLUSH_SPANS or time.monotonic() - self.last_flush >= FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Append the finished spans to the trace file"""
+        with self.lock:
+            spans, self.pending = self.pending, []
+            self.last_flush = time.monotonic()
+        if not spans:
+            return
+        request = {'resourceSpans': [{
+            'resource': {'attributes': otlp_attributes(self.resource)},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': [span.to_otlp() for span in spans]}]
+        }]}
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(request, separators=(',', ':')) + '\n')
+        except OSError as e:
+            logger.warning(f"Could not write {len(spans)} spans to {self.path}: {e}")
+
+
+TRACER = Tracer()
+
+
+def configure(service_name, path, sample_rate=1.0):
+    TRACER.configure(service_name, path, sample_rate)
+
+
+def span(name, kind=INTERNAL, parent=None, **attributes):
+    """Open a span on the process tracer; a shared no-op object while tracing is off"""
+    if not TRACER.enabled:
+        return NOOP_SPAN  # checked here too, to spare the call on every hot-path span
+    return TRACER.span(name, kind, parent, **attributes)
+
+
+def current():
+    """Return the current span, to parent spans opened in another thread or green thread"""
+    return CURRENT_SPAN.get()
+
+
+def flush():
+    TRACER.flush()
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profiler:
+    """Time-boxed sampling of every thread's stack, one profile at a time"""
+
+    def __init__(self):
+        self.lock = os_threading.Lock()
+
+    def sample(self, seconds, interval):
+        """Sample all other threads every interval seconds and return folded stacks"""
+        own = os_threading.get_ident()
+        names = {thread.ident: thread.name for thread in os_threading.enumerate()}
+        stacks = Counter()
+        deadline = os_time.monotonic() + seconds
+        while os_time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                stacks[';'.join(reversed(stack))] += 1
+            os_time.sleep(interval)
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def profile(self, seconds, interval=0.005):
+        """Profile the process for seconds (capped at MAX_PROFILE_SECONDS); None if one is already running
+
+        The output is Brendan Gregg's folded format ('a;b;c count' per line), as read by
+        flamegraph.pl, inferno and speedscope"""
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            result = []
+            # A real OS thread, so that waiting below lets an eventlet hub (if any) keep serving
+            sampler = os_threading.Thread(target=lambda: result.append(
+                self.sample(min(seconds, MAX_PROFILE_SECONDS), interval)), name='profiler', daemon=True)
+            sampler.start()
+            while sampler.is_alive():
+                time.sleep(0.05)
+            return result[0] if result else ''
+        finally:
+            self.lock.release()
+
+
+PROFILER = Profiler()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Transports used by the fleet simulator to write readings into Ditto
+HTTP (pooled keep-alive connections) or one persistent Ditto Protocol WebSocket
+"""
+
+import asyncio
+import json
+import uuid
+import random
+import logging
+from collections import deque
+
+import aiohttp
+
+from encoding import BodyEncoder, JSON
+from statuses import ACCEPTED, TIMED_OUT, TOO_MANY_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+MERGE_PATCH = 'application/merge-patch+json'
+
+
+class HttpTransport:
+    def __init__(self, config):
+        """Initialize the HTTP transport from the sensor configuration."""
+        fleet = config.get('fleet', {})
+        self.base_url = config['ditto_api_url']
+        self.auth = aiohttp.BasicAuth(config['username'], config['password'])
+        self.connection_pool_size = fleet.get('connection_pool_size', 200)
+        self.request_timeout = fleet.get('request_timeout', 10)
+        self.encoder = BodyEncoder(config.get('body_encoding', 'json'))
+        self.session = None
+
+    async def start(self):
+        """Open the pooled client session."""
+        connector = aiohttp.TCPConnector(limit=self.connection_pool_size, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout, auth=self.auth)
+
+    async def close(self):
+        """Close the client session and its connections."""
+        if self.session:
+            await self.session.close()
+
+    def queue_depth(self):
+        """Requests are never queued inside the HTTP transport."""
+        return 0
+
+    async def request(self, method, url, value, content_type=JSON, headers=None):
+        """Send a value and return the status, TIMED_OUT or None on network errors.
+
+        Plain JSON bodies go out in the configured body encoding; merge patches are always JSON."""
+        if content_type == JSON:
+            body, content_type = self.encoder.encode(value)
+        else:
+            body = json.dumps(value, separators=(',', ':'))
+        try:
+            async with self.session.request(method, url, data=body,
+                                            headers={'Content-Type': content_type, **(headers or {})}) as response:
+                await response.read()
+            if self.encoder.rejected(response.status):
+                return await self.request(method, url, value, JSON, headers)
+            return response.status
+        except asyncio.TimeoutError:
+            logger.debug(f"Timeout for {url}")
+            return TIMED_OUT
+        except aiohttp.ClientError as e:
+            logger.debug(f"Network error for {url}: {e}")
+            return None
+
+    async def modify(self, thing_id, path, value):
+        """Modify a path of a thing."""
+        return await self.request('PUT', f"{self.base_url}/api/2/things/{thing_id}{path}", value)
+
+    async def merge(self, thing_id, path, value):
+        """Merge a JSON merge patch into a path of a thing."""
+        return await self.request('PATCH', f"{self.base_url}/api/2/things/{thing_id}{path}", value, MERGE_PATCH)
+
+    async def create_thing(self, thing_id, thing_json, if_absent=False):
+        """Create (or overwrite) a whole thing; with if_absent an existing thing is left alone and answers 412."""
+        return await self.request('PUT', f"{self.base_url}/api/2/things/{thing_id}", thing_json,
+                                  headers={'If-None-Match': '*'} if if_absent else None)
+
+    async def create_policy(self, policy_id, policy_json):
+        """Create a policy unless it exists (answered with 412)."""
+        return await self.request('PUT', f"{self.base_url}/api/2/policies/{policy_id}", policy_json,
+                                  headers={'If-None-Match': '*'})
+
+    async def search_thing_ids(self, rql_filter, page_size=200):
+        """Return the IDs of all things matching an RQL filter, or None if the search failed."""
+        url = f"{self.base_url}/api/2/search/things"
+        thing_ids = set()
+        cursor = None
+        try:
+            while True:
+                option = f"size({page_size})" + (f",cursor({cursor})" if cursor else "")
+                params = {'filter': rql_filter, 'fields': 'thingId', 'option': option}
+                async with self.session.get(url, params=params) as response:
+                    if response.status != 200:
+                        logger.debug(f"Search returned {response.status}")
+                        return None
+                    page = await response.json()
+                thing_ids.update(item['thingId'] for item in page.get('items', []))
+                cursor = page.get('cursor')
+                if not cursor:
+                    return thing_ids
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            logger.debug(f"Search failed: {e}")
+            return None
+
+
+class DittoWebSocketTransport:
+    def __init__(self, config, expire_queued=False):
+        """Initialize the WebSocket transport from the sensor configuration.
+
+        Queued commands wait for the socket to come back unless expire_queued is set (callers that
+        re-buffer timed out readings in the journal, or must finish like the benchmark)."""
+        ws = config.get('websocket', {})
+        default_url = config['ditto_api_url'].replace('http', 'ws', 1) + '/ws/2'
+        self.url = ws.get('url') or default_url
+        self.auth = aiohttp.BasicAuth(config['username'], config['password'])
+        self.response_required = ws.get('response_required', True)
+        self.max_in_flight = ws.get('max_in_flight', 1000)
+        self.response_timeout = ws.get('response_timeout', 10)
+        self.max_queued = ws.get('max_queued', 100000)
+        self.expire_queued = expire_queued
+        self.backoff_initial = ws.get('reconnect_backoff_min', 1)
+        self.backoff_max = ws.get('reconnect_backoff_max', 30)
+
+        self.session = None
+        self.connection_task = None
+        self.sweep_task = None
+        self.queue_ready = asyncio.Event()
+        # Envelopes waiting to be written; unacknowledged ones are put back in front on reconnect
+        self.pending = deque()
+        self.in_flight = {}
+        self.in_flight_slots = asyncio.Semaphore(self.max_in_flight)
+        self.reconnects = 0
+
+    @staticmethod
+    def topic(thing_id, action):
+        """Build the Ditto Protocol topic of a twin command."""
+        namespace, name = thing_id.split(':', 1)
+        return f"{namespace}/{name}/things/twin/commands/{action}"
+
+    async def start(self):
+        """Open the session and keep the WebSocket connected in the background."""
+        self.session = aiohttp.ClientSession(auth=self.auth)
+        self.connection_task = asyncio.create_task(self.maintain_connection())
+        self.sweep_task = asyncio.create_task(self.expire_commands())
+
+    async def close(self):
+        """Stop reconnecting, close the socket and fail the commands still waiting (no connection)."""
+        for task in (self.connection_task, self.sweep_task):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        for _, future, _ in [*self.pending, *self.in_flight.values()]:
+            if not future.done():
+                future.set_result(None)
+        self.pending.clear()
+        self.in_flight.clear()
+        if self.session:
+            await self.session.close()
+
+    def queue_depth(self):
+        """Return the number of commands waiting for the socket."""
+        return len(self.pending)
+
+    async def maintain_connection(self):
+        """Connect, pump envelopes and reconnect with exponential backoff."""
+        backoff = self.backoff_initial
+        while True:
+            try:
+                async with self.session.ws_connect(self.url, heartbeat=30) as ws:
+                    logger.info(f"🔌 WebSocket connected to {self.url}")
+                    backoff = self.backoff_initial
+                    writer = asyncio.create_task(self.write_loop(ws))
+                    try:
+                        await self.read_loop(ws)
+                    finally:
+                        writer.cancel()
+                        await asyncio.gather(writer, return_exceptions=True)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"⚠️ WebSocket connection failed: {e}")
+            except Exception as e:
+                logger.exception(f"❌ Unexpected WebSocket error: {e}")
+
+            self.requeue_in_flight()
+            self.reconnects += 1
+            delay = random.uniform(0, backoff)
+            logger.warning(f"🔁 WebSocket disconnected, reconnecting in {delay:.1f}s "
+                           f"({len(self.pending)} commands queued)")
+            await asyncio.sleep(delay)
+            backoff = min(backoff * 2, self.backoff_max)
+
+    def requeue_in_flight(self):
+        """Put unacknowledged envelopes back in front of the queue, oldest first."""
+        for envelope, future, sent_at in sorted(self.in_flight.values(), key=lambda entry: entry[2], reverse=True):
+            self.pending.appendleft((envelope, future, sent_at))
+            self.in_flight_slots.release()
+        self.in_flight.clear()
+        if self.pending:
+            self.queue_ready.set()
+
+    async def write_loop(self, ws):
+        """Pipeline queued envelopes onto the socket up to max_in_flight."""
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.pending:
+                self.queue_ready.clear()
+                await self.queue_ready.wait()
+                continue
+
+            await self.in_flight_slots.acquire()
+            if not self.pending:
+                # Expired while waiting for a slot
+                self.in_flight_slots.release()
+                continue
+            envelope, future, _ = self.pending.popleft()
+            correlation_id = envelope['headers']['correlation-id']
+            # Tracked before writing so a broken socket requeues it on reconnect
+            self.in_flight[correlation_id] = (envelope, future, loop.time())
+            await ws.send_str(json.dumps(envelope))
+            if not self.response_required:
+                del self.in_flight[correlation_id]
+                self.in_flight_slots.release()
+                if not future.done():
+                    future.set_result(ACCEPTED)
+
+    async def read_loop(self, ws):
+        """Resolve in-flight commands from their correlated responses."""
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                if msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    break
+                continue
+            try:
+                response = json.loads(msg.data)
+            except ValueError:
+                continue  # e.g. START-SEND-* acknowledgements
+            if not isinstance(response, dict):
+                continue
+            headers = response.get('headers')
+            correlation_id = headers.get('correlation-id') if isinstance(headers, dict) else None
+            entry = self.in_flight.pop(correlation_id, None)
+            if entry is None:
+                continue
+            self.in_flight_slots.release()
+            future = entry[1]
+            if not future.done():
+                future.set_result(response.get('status'))
+
+    async def expire_commands(self):
+        """Fail sent commands that were not answered within response_timeout (queued ones too if expire_queued)."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(1)
+            deadline = loop.time() - self.response_timeout
+            expired = [cid for cid, (_, _, sent_at) in self.in_flight.items() if sent_at < deadline]
+            for correlation_id in expired:
+                _, future, _ = self.in_flight.pop(correlation_id)
+                self.in_flight_slots.release()
+                if not future.done():
+                    future.set_result(TIMED_OUT)
+            # Otherwise queued commands survive any outage, the queue is bounded by max_queued instead
+            if self.expire_queued and any(queued_at < deadline or future.done() for _, future, queued_at in self.pending):
+                waiting = deque()
+                for envelope, future, queued_at in self.pending:
+                    if future.done():
+                        continue
+                    if queued_at < deadline:
+                        future.set_result(TIMED_OUT)
+                    else:
+                        waiting.append((envelope, future, queued_at))
+                self.pending = waiting
+
+    async def send_command(self, thing_id, action, path, value, content_type=None):
+        """Queue a Ditto Protocol command and wait for its status."""
+        envelope = {
+            "topic": self.topic(thing_id, action),
+            "headers": {
+                "correlation-id": str(uuid.uuid4()),
+                "response-required": self.response_required
+            },
+            "path": path,
+            "value": value
+        }
+        if content_type:
+            envelope['headers']['content-type'] = content_type
+        if len(self.pending) >= self.max_queued:
+            return TOO_MANY_REQUESTS
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((envelope, future, loop.time()))
+        self.queue_ready.set()
+        return await future
+
+    async def modify(self, thing_id, path, value):
+        """Modify a path of a thing."""
+        return await self.send_command(thing_id, 'modify', path, value)
+
+    async def merge(self, thing_id, path, value):
+        """Merge a JSON merge patch into a path of a thing."""
+        return await self.send_command(thing_id, 'merge', path, value, MERGE_PATCH)
+
+    async def create_thing(self, thing_id, thing_json):
+        """Create (or overwrite) a whole thing."""
+        return await self.send_command(thing_id, 'modify', '/', thing_json)
+
+
+def create_transport(config, expire_queued=False):
+    """Create the transport selected by the 'transport' config key."""
+    if config.get('transport', 'http') == 'websocket':
+        return DittoWebSocketTransport(config, expire_queued)
+    return HttpTransport(config)